@@ -1,11 +1,43 @@
 import streamlit as st
 import requests
+from requests.adapters import HTTPAdapter
+import asyncio
+import httpx
+import orjson
+import dbm
+import gzip
+import pickle
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from collections import OrderedDict
+from heapq import nlargest
 
 # App config
 st.set_page_config(
         page_title="Discussion Analysis", layout = "wide")
 
 
+# Persistent store of completed discussions, keyed by URL and shared by every session
+DISCUSSION_STORE_PATH = "discussions.db"
+
+@st.cache_resource
+def get_discussion_store():
+    return dbm.open(DISCUSSION_STORE_PATH, "c"), threading.Lock()
+
+def load_discussions():
+    store, lock = get_discussion_store()
+    with lock:
+        return [pickle.loads(gzip.decompress(store[key])) for key in store.keys()]
+
+def save_discussion(url, discussion):
+    store, lock = get_discussion_store()
+    with lock:
+        store[url] = gzip.compress(pickle.dumps(discussion, protocol=5))
+        # The handle is never closed, so flush each write (dbm.dumb only writes its index on sync)
+        if hasattr(store, "sync"):
+            store.sync()
+
+
 # Session state initialization
 if 'page' not in st.session_state:
     st.session_state.page = 'home'
@@ -14,7 +46,11 @@ if 'history' not in st.session_state:
     st.session_state.history = []
 
 if "discussions" not in st.session_state:
-    st.session_state.discussions = []
+    st.session_state.discussions = load_discussions()
+
+# URL index over the saved discussions for O(1) lookups
+if "discussions_by_url" not in st.session_state:
+    st.session_state.discussions_by_url = {d.get("url"): d for d in st.session_state.discussions}
 
 if "selected_discussion" not in st.session_state:
     st.session_state.selected_discussion = None
@@ -29,25 +65,216 @@ if "processing_state" not in st.session_state:
         "kg_info": None
     }
 
+# Shared HTTP session so backend calls reuse keep-alive connections
+if "http" not in st.session_state:
+    st.session_state.http = requests.Session()
+    st.session_state.http.mount("http://", HTTPAdapter(pool_connections=32, pool_maxsize=32))
+
 # Backend URLs
 backend_url = "http://127.0.0.1:8000"
 summarizer_endpoint = f"{backend_url}/summarizer"
 reddit_scraper_endpoint = f"{backend_url}/reddit_scraper" 
 topicIdentifier_endpoint = f"{backend_url}/topicIdentifier"
 stanceClassifier_endpoint = f"{backend_url}/stanceClassifier"
+stanceClassifierBatch_endpoint = f"{backend_url}/stanceClassifier_batch"
 kgCreator_endpoint = f"{backend_url}/kgCreator"
 
-# Helper function to render replies
-def render_replies(replies):
-    for reply in replies:
-        stance_emoji = {
-            "FOR": "🟩",
-            "AGAINST": "🟥",
-            "NEUTRAL": "🟨"
-        }.get(reply["stance"], "🟨")
-        st.markdown(f"↳ **{reply['author']}** ({reply['score']} points) {stance_emoji}")
-        formatted_reply = "\n> ".join(reply["body"].split("\n"))
-        st.markdown(f"> {formatted_reply}")
+# Maximum number of comments/replies sent in a single stance classification call
+STANCE_BATCH_SIZE = 32
+
+# Emoji shown next to each reply for its stance
+STANCE_EMOJI = {
+    "FOR": "🟩",
+    "AGAINST": "🟥",
+    "NEUTRAL": "🟨"
+}
+
+# Backend payloads are encoded/decoded with orjson
+JSON_HEADERS = {"Content-Type": "application/json"}
+
+# Helper function that POSTs a JSON payload through the shared session
+# (worker threads pass a session of their own, since they can't read st.session_state and
+# a requests.Session isn't safe to share with the main thread)
+def post_json(endpoint, payload, timeout=60, session=None):
+    session = session or st.session_state.http
+    return session.post(endpoint, data=orjson.dumps(payload), headers=JSON_HEADERS, timeout=timeout)
+
+# Helper function that builds the knowledge graph on a worker thread, with its own session
+def post_kg_payload(kg_payload):
+    with requests.Session() as session:
+        return post_json(
+            kgCreator_endpoint,
+            {"thread_data": kg_payload},
+            timeout=600,  # Argument extraction runs many LLM calls
+            session=session
+        )
+
+# Helper function that keeps only the comment/reply fields the KG creator stores
+# (drops parent_body, which repeats the parent's text on every reply, and the display-only fields)
+def kg_comment(comment):
+    return {
+        "id": comment.get("id"),
+        "body": comment.get("body"),
+        "author": comment.get("author"),
+        "score": comment.get("score"),
+        "replies": [kg_comment(reply) for reply in comment.get("replies", [])]
+    }
+
+# Helper function that describes a failed backend call (the backend's answer when there is one,
+# otherwise the timeout or connection error itself)
+def request_error_text(error):
+    return error.response.text if error.response is not None else str(error)
+
+# Background workers for backend calls that can overlap, shared by every session
+@st.cache_resource
+def get_executor():
+    return ThreadPoolExecutor(max_workers=4)
+
+# How long cached backend responses are kept (seconds)
+CACHE_TTL = 24 * 60 * 60
+
+# Cached backend calls - failed responses raise, so they are never cached
+@st.cache_data(ttl=CACHE_TTL, show_spinner=False)
+def scrape_thread(url):
+    response = post_json(reddit_scraper_endpoint, {"url": url})
+    response.raise_for_status()
+    return orjson.loads(response.content).get("thread_data")
+
+@st.cache_data(ttl=CACHE_TTL, show_spinner=False)
+def identify_topic(text):
+    response = post_json(topicIdentifier_endpoint, {"text": text})
+    response.raise_for_status()
+    return orjson.loads(response.content).get("topic")
+
+# Summaries are cached as a shared resource; callers get a copy of the dict
+# (the summarizer makes up to three long gpt-4o calls, so it gets a longer timeout)
+@st.cache_resource(ttl=CACHE_TTL, show_spinner=False)
+def summarize(grouped_bodies_json):
+    response = st.session_state.http.post(
+        summarizer_endpoint,
+        data=grouped_bodies_json,
+        headers=JSON_HEADERS,
+        timeout=300
+    )
+    response.raise_for_status()
+    return orjson.loads(response.content).get("summaries", {})
+
+# Stance results keyed by (thread title, topic, comment body), shared across reruns and sessions
+# (an LRU bounded to STANCE_CACHE_SIZE entries, with a lock since sessions run in parallel)
+STANCE_CACHE_SIZE = 50_000
+
+@st.cache_resource(ttl=CACHE_TTL, show_spinner=False)
+def get_stance_cache():
+    return OrderedDict(), threading.Lock()
+
+# Helper function that derives the sidebar title of a discussion from its topic
+def derive_display_title(raw_topic):
+    # Strip markdown formatting (remove asterisks)
+    clean_topic = raw_topic.replace("*", "")
+    
+    # Get the first line or the whole thing if it's a single line
+    main_topic_line = clean_topic.splitlines()[0] if clean_topic else "Untitled"
+    
+    # Further clean up if it starts with "Main Topic:"
+    topic_title = main_topic_line.split(":", 1)[1].strip() if "Main Topic:" in main_topic_line else main_topic_line
+    
+    # Truncate if too long
+    if len(topic_title) > 60:
+        topic_title = topic_title[:57] + "..."
+
+    return topic_title
+
+# Helper function that draws a divider with extra spacing above it (styled by .section-divider)
+def section_divider():
+    st.markdown('<hr class="section-divider">', unsafe_allow_html=True)
+
+# Helper functions that build the stance distribution bar and its legend
+def stance_bar_html(stance_percentages):
+    return f"""
+        <div style="display: flex; width: 100%; height: 25px; 
+                    border-radius: 15px; overflow: hidden; 
+                    border: 2px solid #ddd; margin-bottom: 20px; box-shadow: 2px 2px 5px rgba(0,0,0,0.2);">
+            <div style="width: {stance_percentages['FOR']}%; background: linear-gradient(to right, #27ae60, #2ecc71);"></div>
+            <div style="width: {stance_percentages['NEUTRAL']}%; background: linear-gradient(to right, #f1c40f, #f39c12);"></div>
+            <div style="width: {stance_percentages['AGAINST']}%; background: linear-gradient(to right, #e74c3c, #c0392b);"></div>
+        </div>
+    """
+
+def stance_legend_html(stance_percentages):
+    return f"""
+        <div style="display: flex; align-items: center; gap: 15px; margin-bottom: 30px;">
+            <div style="display: flex; align-items: center;">
+                <div style="width: 15px; height: 15px; background-color: #2ecc71; border-radius: 3px; margin-right: 5px;"></div>
+                <span><b>For:</b> {stance_percentages['FOR']:.0f}%</span>
+            </div>
+            <div style="display: flex; align-items: center;">
+                <div style="width: 15px; height: 15px; background-color: #f1c40f; border-radius: 3px; margin-right: 5px;"></div>
+                <span><b>Neutral:</b> {stance_percentages['NEUTRAL']:.0f}%</span>
+            </div>
+            <div style="display: flex; align-items: center;">
+                <div style="width: 15px; height: 15px; background-color: #e74c3c; border-radius: 3px; margin-right: 5px;"></div>
+                <span><b>Against:</b> {stance_percentages['AGAINST']:.0f}%</span>
+            </div>
+        </div>
+    """
+
+# Helper function that renders replies as a single markdown string
+def replies_md(replies):
+    return "\n\n".join(
+        f"↳ **{reply['author']}** ({reply['score']} points) {STANCE_EMOJI.get(reply['stance'], '🟨')}\n\n> "
+        + "\n> ".join(reply["body"].split("\n"))
+        for reply in replies
+    )
+
+# Helper function that renders a group of comments and their replies as a single markdown string
+def comments_md(comments):
+    return "".join(
+        f"**{comment['author']}** ({comment['score']} points)\n\n{comment['body']}\n\n{replies_md(comment['replies'])}\n\n---\n\n"
+        for comment in comments
+    )
+
+# Helper function that groups every classified comment and reply body by its stance
+def bodies_by_stance(grouped_comments):
+    bodies = {stance: [comment["body"] for comment in comments] for stance, comments in grouped_comments.items()}
+    for comments in grouped_comments.values():
+        for comment in comments:
+            for reply in comment["replies"]:
+                bodies[reply["stance"]].append(reply["body"])
+    return bodies
+
+# Helper coroutine that classifies the stance of a chunk of comments/replies in one call
+# (returns None if the call failed - an error answer, a timeout or a connection error)
+async def classify_batch(client, thread_context, items):
+    try:
+        response = await client.post(
+            stanceClassifierBatch_endpoint,
+            content=orjson.dumps({**thread_context, "items": items}),
+            headers=JSON_HEADERS
+        )
+    except httpx.HTTPError:
+        return None
+    return orjson.loads(response.content).get("stances", {}) if response.status_code == 200 else None
+
+# Dispatch the chunked classification requests concurrently over one keep-alive client
+# (returns the stances, and how many comments/replies were in chunks whose call failed)
+async def classify_all(thread_context, items, on_progress):
+    chunks = [items[start:start + STANCE_BATCH_SIZE] for start in range(0, len(items), STANCE_BATCH_SIZE)]
+    limits = httpx.Limits(max_connections=32, max_keepalive_connections=16)
+    async with httpx.AsyncClient(base_url=backend_url, limits=limits, timeout=60) as client:
+        async def classify_chunk(chunk):
+            return chunk, await classify_batch(client, thread_context, chunk)
+
+        tasks = [classify_chunk(chunk) for chunk in chunks]
+        stances = {}
+        failed = 0
+        for done, task in enumerate(asyncio.as_completed(tasks), start=1):
+            chunk, chunk_stances = await task
+            if chunk_stances is None:
+                failed += len(chunk)
+            else:
+                stances.update(chunk_stances)
+            on_progress(done, len(tasks))
+        return stances, failed
 
 # Sidebar
 st.sidebar.title("Discussion Navigator")
@@ -82,30 +309,26 @@ st.markdown("""
         height: auto !important;
         padding: 10px !important;
     }
+    .section-divider {
+        margin: calc(2em + 30px) 0 2em 0;
+        border: none;
+        border-top: 1px solid rgba(49, 51, 63, 0.2);
+    }
 </style>
 """, unsafe_allow_html=True)
 
-# Display saved discussions in sidebar
-for idx, discussion in enumerate(st.session_state.discussions):
-    raw_topic = discussion.get("topic", "")
-    
-    # Strip markdown formatting (remove asterisks)
-    clean_topic = raw_topic.replace("*", "")
-    
-    # Get the first line or the whole thing if it's a single line
-    main_topic_line = clean_topic.splitlines()[0] if clean_topic else "Untitled"
-    
-    # Further clean up if it starts with "Main Topic:"
-    topic_title = main_topic_line.split(":", 1)[1].strip() if "Main Topic:" in main_topic_line else main_topic_line
-    
-    # Truncate if too long
-    if len(topic_title) > 60:
-        topic_title = topic_title[:57] + "..."
-        
-    if st.sidebar.button(topic_title, key=f"discussion_{idx}"):
-        st.session_state.page = "discussion_view"
-        st.session_state.selected_discussion = discussion
-        st.rerun()
+# Display saved discussions in sidebar (as a fragment, so it reruns in isolation)
+@st.fragment
+def render_saved_discussions():
+    for idx, discussion in enumerate(st.session_state.discussions):
+        topic_title = discussion.get("display_title") or "Untitled"
+        if st.button(topic_title, key=f"discussion_{idx}"):
+            st.session_state.page = "discussion_view"
+            st.session_state.selected_discussion = discussion
+            st.rerun()
+
+with st.sidebar:
+    render_saved_discussions()
 
 # Home Page Input
 if st.session_state.page == 'home':
@@ -116,7 +339,7 @@ if st.session_state.page == 'home':
     # Check if URL already processed
     if st.button("Go!", type="primary") and reddit_url:
         # Check if we already have this URL in discussions
-        existing_discussion = next((d for d in st.session_state.discussions if d.get("url") == reddit_url), None)
+        existing_discussion = st.session_state.discussions_by_url.get(reddit_url)
         if existing_discussion:
             # We've already analyzed this URL, so use cached results
             st.session_state.page = "discussion_view"
@@ -135,33 +358,27 @@ elif st.session_state.page == 'incremental_analysis':
     # Step 1: Scrape Reddit and identify discussion topic
     if process_state["thread_data"] is None:
         with st.spinner("Initializing analysis..."):
-            scrape_response = requests.post(reddit_scraper_endpoint, json={"url": reddit_url})
-
-        if scrape_response.status_code == 200:
-            thread_data = scrape_response.json().get("thread_data")
-            process_state["thread_data"] = thread_data
-
-            # Identify the discussion topic
-            with st.spinner("Identifying discussion topic..."):
-                full_text = f"{thread_data['post']['title']} {thread_data['post']['selftext']}"
-                topicIdentifier_response = requests.post(
-                    topicIdentifier_endpoint,
-                    json={"text": full_text} 
-                )
-
-            if topicIdentifier_response.status_code == 200:
-                topicIdentifier = topicIdentifier_response.json().get("topic")
-                process_state["topic"] = topicIdentifier
-            else:
-                st.error(f"Failed to identify the discussion topic: {topicIdentifier_response.text}")
+            try:
+                thread_data = scrape_thread(reddit_url)
+            except requests.RequestException as e:
+                st.error(f"Failed to scrape Reddit thread: {request_error_text(e)}")
+                st.stop()
+
+        process_state["thread_data"] = thread_data
+
+        # Identify the discussion topic
+        with st.spinner("Identifying discussion topic..."):
+            full_text = f"{thread_data['post']['title']} {thread_data['post']['selftext']}"
+            try:
+                topicIdentifier = identify_topic(full_text)
+            except requests.RequestException as e:
+                st.error(f"Failed to identify the discussion topic: {request_error_text(e)}")
                 topicIdentifier = "Unidentified Topic"
-                process_state["topic"] = topicIdentifier
 
-            if topicIdentifier not in [t[0] for t in st.session_state.history]:
-                st.session_state.history.append((topicIdentifier, reddit_url))
-        else:
-            st.error(f"Failed to scrape Reddit thread: {scrape_response.text}")
-            st.stop()
+        process_state["topic"] = topicIdentifier
+
+        if topicIdentifier not in [t[0] for t in st.session_state.history]:
+            st.session_state.history.append((topicIdentifier, reddit_url))
     
     # Display the header and basic info as soon as we have it
     thread_data = process_state["thread_data"]
@@ -181,86 +398,93 @@ elif st.session_state.page == 'incremental_analysis':
         top_comments = thread_data['comments']
 
         grouped_comments = {"FOR": [], "AGAINST": [], "NEUTRAL": []}
-        all_classified_bodies = {"FOR": [], "AGAINST": [], "NEUTRAL": []}
-        all_replies = []  
+        stance_counts = {"FOR": 0, "AGAINST": 0, "NEUTRAL": 0}
+
+        status_placeholder = st.empty()
+        status = status_placeholder.status("Classifying comments...", expanded=False)
 
-        progress_bar = st.progress(0)
-        status_text = st.empty()
+        # Only refresh the status label ~20 times, not on every completed batch
+        def update_progress(done, total):
+            if done == total or done % max(1, total // 20) == 0:
+                status.update(label=f"Classifying comments (batch {done}/{total})")
 
+        # Build one classification item per comment and per top-5 reply
+        thread_context = {
+            "thread_title": thread_data['post']['title'],
+            "thread_selftext": thread_data['post']['selftext'],
+            "identified_topic": topicIdentifier
+        }
+        top_replies = []
+        items = []
         for i, comment in enumerate(top_comments):
-            sorted_replies = sorted(comment['replies'], key=lambda x: x['score'], reverse=True)[:5]
+            sorted_replies = nlargest(5, comment['replies'], key=lambda x: x['score'])
+            top_replies.append(sorted_replies)
             parent_context = f"Parent Comment: {comment.get('parent_body', 'N/A')}\n\n" if 'parent_body' in comment else ""
 
-            progress = (i + 1) / len(top_comments)
-            progress_bar.progress(progress)
-            status_text.text(f"Classifying comment {i+1}/{len(top_comments)}")
-
-            stance_response = requests.post(
-                stanceClassifier_endpoint,
-                json={
-                    "thread_title": thread_data['post']['title'],
-                    "thread_selftext": thread_data['post']['selftext'],
-                    "identified_topic": topicIdentifier,
-                    "comment_body": f"{parent_context}{comment['body']}"
-                }
-            )
-
-            if stance_response.status_code == 200:
-                stance_result = stance_response.json().get("stance", "NEUTRAL")
-
-                classified_replies = []
-                for reply in sorted_replies:
-                    reply_stance_response = requests.post(
-                        stanceClassifier_endpoint,
-                        json={
-                            "thread_title": thread_data['post']['title'],
-                            "thread_selftext": thread_data['post']['selftext'],
-                            "identified_topic": topicIdentifier,
-                            "comment_body": reply['body']
-                        }
-                    )
-                    reply_stance = reply_stance_response.json().get("stance", "NEUTRAL") if reply_stance_response.status_code == 200 else "NEUTRAL"
-
-                    classified_replies.append({
-                        "author": reply["author"],
-                        "score": reply["score"],
-                        "body": reply["body"],
-                        "stance": reply_stance
-                    })
-
-                    all_classified_bodies[reply_stance].append(reply["body"])
-
-                # Append replies of this comment to the global all_replies list
-                all_replies.extend(classified_replies)
-
-                grouped_comments[stance_result].append({
-                    "author": comment["author"],
-                    "score": comment["score"],
-                    "body": comment["body"],
-                    "replies": classified_replies
-                })
+            items.append({"id": f"c{i}", "comment_body": f"{parent_context}{comment['body']}"})
+            for j, reply in enumerate(sorted_replies):
+                items.append({"id": f"r{i}.{j}", "comment_body": reply['body']})
 
-                all_classified_bodies[stance_result].append(comment["body"])
+        # Only send comments/replies whose stance is not cached yet
+        stance_cache, stance_cache_lock = get_stance_cache()
+        cache_keys = {
+            item["id"]: (thread_context["thread_title"], topicIdentifier, item["comment_body"])
+            for item in items
+        }
+        stances = {}
+        with stance_cache_lock:
+            for item_id, key in cache_keys.items():
+                if key in stance_cache:
+                    stance_cache.move_to_end(key)
+                    stances[item_id] = stance_cache[key]
+        pending_items = [item for item in items if item["id"] not in stances]
+
+        new_stances, failed_count = asyncio.run(classify_all(thread_context, pending_items, update_progress))
+        if failed_count:
+            st.warning(f"Failed to classify the stance of {failed_count} comments/replies - they are left out of the analysis.")
+        with stance_cache_lock:
+            for item_id, stance in new_stances.items():
+                stance_cache[cache_keys[item_id]] = stance
+                stance_cache.move_to_end(cache_keys[item_id])
+            while len(stance_cache) > STANCE_CACHE_SIZE:
+                stance_cache.popitem(last=False)
+        stances.update(new_stances)
+
+        # Reassemble the results by id, keeping the original comment order
+        for i, comment in enumerate(top_comments):
+            stance_result = stances.get(f"c{i}")
+            if stance_result is None:
+                continue
+
+            classified_replies = []
+            for j, reply in enumerate(top_replies[i]):
+                reply_stance = stances.get(f"r{i}.{j}", "NEUTRAL")
+
+                classified_replies.append({
+                    "id": reply["id"],
+                    "author": reply["author"],
+                    "score": reply["score"],
+                    "body": reply["body"],
+                    "stance": reply_stance
+                })
 
-        progress_bar.empty()
-        status_text.empty()
+                stance_counts[reply_stance] += 1
 
-        process_state["grouped_comments"] = grouped_comments
-        process_state["all_classified_bodies"] = all_classified_bodies
+            grouped_comments[stance_result].append({
+                "id": comment["id"],
+                "author": comment["author"],
+                "score": comment["score"],
+                "body": comment["body"],
+                "replies": classified_replies
+            })
 
-        # Calculate stance distribution
-        stance_counts = {"FOR": 0, "AGAINST": 0, "NEUTRAL": 0}
+            stance_counts[stance_result] += 1
 
-        # Count stance from comments
-        for stance in grouped_comments:
-            stance_counts[stance] += len(grouped_comments[stance])
+        status_placeholder.empty()
 
-        # Count stance from **all** replies (not just last comment’s)
-        for reply in all_replies:
-            reply_stance = reply.get("stance")
-            if reply_stance in stance_counts:
-                stance_counts[reply_stance] += 1
+        process_state["grouped_comments"] = grouped_comments
 
+        # Calculate stance distribution (counted while classifying)
         total = sum(stance_counts.values())
         stance_percentages = {
             stance: (count / total) * 100 if total > 0 else 0
@@ -273,53 +497,40 @@ elif st.session_state.page == 'incremental_analysis':
     if process_state["stance_percentages"]:
         stance_percentages = process_state["stance_percentages"]
         
-        bar_style = f"""
-            <div style="display: flex; width: 100%; height: 25px; 
-                        border-radius: 15px; overflow: hidden; 
-                        border: 2px solid #ddd; margin-bottom: 20px; box-shadow: 2px 2px 5px rgba(0,0,0,0.2);">
-                <div style="width: {stance_percentages['FOR']}%; background: linear-gradient(to right, #27ae60, #2ecc71);"></div>
-                <div style="width: {stance_percentages['NEUTRAL']}%; background: linear-gradient(to right, #f1c40f, #f39c12);"></div>
-                <div style="width: {stance_percentages['AGAINST']}%; background: linear-gradient(to right, #e74c3c, #c0392b);"></div>
-            </div>
-        """
-        st.markdown("<div style='margin-bottom: 30px;'></div>", unsafe_allow_html=True)
-        st.divider()
+        bar_style = stance_bar_html(stance_percentages)
+        section_divider()
         st.subheader("📊 Stance Distribution")
         st.markdown(bar_style, unsafe_allow_html=True)
 
-        legend_html = f"""
-            <div style="display: flex; align-items: center; gap: 15px;">
-                <div style="display: flex; align-items: center;">
-                    <div style="width: 15px; height: 15px; background-color: #2ecc71; border-radius: 3px; margin-right: 5px;"></div>
-                    <span><b>For:</b> {stance_percentages['FOR']:.0f}%</span>
-                </div>
-                <div style="display: flex; align-items: center;">
-                    <div style="width: 15px; height: 15px; background-color: #f1c40f; border-radius: 3px; margin-right: 5px;"></div>
-                    <span><b>Neutral:</b> {stance_percentages['NEUTRAL']:.0f}%</span>
-                </div>
-                <div style="display: flex; align-items: center;">
-                    <div style="width: 15px; height: 15px; background-color: #e74c3c; border-radius: 3px; margin-right: 5px;"></div>
-                    <span><b>Against:</b> {stance_percentages['AGAINST']:.0f}%</span>
-                </div>
-            </div>
-        """
-
+        legend_html = stance_legend_html(stance_percentages)
         st.markdown(legend_html, unsafe_allow_html=True)
-        st.markdown("<div style='margin-bottom: 30px;'></div>", unsafe_allow_html=True)
 
     st.divider()
+
+    # Start the KG build in the background so it overlaps with the summarizer
+    if process_state["kg_info"] is None and process_state["grouped_comments"] and "_kg_future" not in process_state:
+        # Send only the post metadata the KG creator needs plus the classified comments
+        kg_payload = {
+            "post": {
+                "title": thread_data['post']['title'],
+                "url": thread_data['post']['url'],
+                "subreddit": thread_data['post']['subreddit']
+            },
+            "classified_comments": {
+                stance: [kg_comment(comment) for comment in comments]
+                for stance, comments in process_state["grouped_comments"].items()
+            }
+        }
+
+        process_state["_kg_future"] = get_executor().submit(post_kg_payload, kg_payload)
     
     # Step 3: Summarize arguments by stance
-    if process_state["stance_summaries"] is None and process_state["all_classified_bodies"]:
+    if process_state["stance_summaries"] is None and process_state["grouped_comments"]:
         with st.spinner("Analyzing arguments by stance..."):
-            stance_summary_response = requests.post(
-                summarizer_endpoint,
-                json={"grouped_comments": process_state["all_classified_bodies"]}
-            )
-
-            if stance_summary_response.status_code == 200:
-                stance_summaries = stance_summary_response.json().get("summaries", {})
-            else:
+            try:
+                grouped_bodies_json = orjson.dumps({"grouped_comments": bodies_by_stance(process_state["grouped_comments"])}, option=orjson.OPT_SORT_KEYS)
+                stance_summaries = summarize(grouped_bodies_json).copy()
+            except requests.RequestException:
                 stance_summaries = {
                     "FOR": "Unable to summarize favorable arguments.",
                     "AGAINST": "Unable to summarize opposing arguments.",
@@ -351,61 +562,54 @@ elif st.session_state.page == 'incremental_analysis':
 
             with expander_col1:
                 with st.expander("Original Favorable Comments", expanded=False):
-                    for comment in grouped_comments["FOR"]:
-                        st.write(f"**{comment['author']}** ({comment['score']} points)")
-                        st.write(comment["body"])
-                        render_replies(comment["replies"])
-                        st.write("---")
+                    st.markdown(comments_md(grouped_comments["FOR"]))
 
             with expander_col2:
                 with st.expander("Original Opposing Comments", expanded=False):
-                    for comment in grouped_comments["AGAINST"]:
-                        st.write(f"**{comment['author']}** ({comment['score']} points)")
-                        st.write(comment["body"])
-                        render_replies(comment["replies"])
-                        st.write("---")
+                    st.markdown(comments_md(grouped_comments["AGAINST"]))
 
             if grouped_comments["NEUTRAL"]:
                 with st.expander("🟨 Neutral Arguments", expanded=False):
                     st.markdown(stance_summaries["NEUTRAL"])
                     st.write("---")
-                    for comment in grouped_comments["NEUTRAL"]:
-                        st.write(f"**{comment['author']}** ({comment['score']} points)")
-                        st.write(comment["body"])
-                        render_replies(comment["replies"])
-                        st.write("---")
+                    st.markdown(comments_md(grouped_comments["NEUTRAL"]))
     
-    st.markdown("<div style='margin-bottom: 30px;'></div>", unsafe_allow_html=True)
-    st.divider()
+    section_divider()
     
     # Step 4: Build knowledge graph
     if process_state["kg_info"] is None and process_state["grouped_comments"]:
         with st.spinner("Building Knowledge Graph..."):
-            thread_data["classified_comments"] = process_state["grouped_comments"]
-
-            kg_response = requests.post(
-                kgCreator_endpoint,
-                json={"thread_data": thread_data}
-            )
-
             kg_info = {
                 "success": False,
                 "discussion_id": "",
                 "node_counts": {},
                 "action": ""
             }
-            
-            if kg_response.status_code == 200:
-                kg_result = kg_response.json()
-                if kg_result.get("status") == "success":
-                    kg_info["success"] = True
-                    kg_info["discussion_id"] = kg_result.get("discussion_id", "N/A")
-                    kg_info["node_counts"] = kg_result.get("nodes_created", {})
-                    kg_info["action"] = kg_result.get("action", "created")
+
+            # Wait for the request started before summarizing
+            # (a timeout or connection error leaves the failure state, not a traceback;
+            # the future is kept if a rerun interrupts the wait, so the next run picks it up)
+            try:
+                kg_response = process_state["_kg_future"].result()
+            except requests.RequestException as e:
+                kg_response = None
+                st.error(f"Failed to build knowledge graph: {e}")
+            process_state.pop("_kg_future", None)
+
+            if kg_response is not None:
+                if kg_response.status_code == 200:
+                    kg_result = orjson.loads(kg_response.content)
+                    if kg_result.get("status") == "success":
+                        kg_info["success"] = True
+                        kg_info["discussion_id"] = kg_result.get("discussion_id", "N/A")
+                        kg_info["node_counts"] = kg_result.get("nodes_created", {})
+                        kg_info["action"] = kg_result.get("action", "created")
+                        if kg_result.get("extraction_failures"):
+                            st.warning(f"Arguments of {kg_result['extraction_failures']} comments/replies couldn't be extracted - they will be retried the next time this thread is analyzed.")
+                    else:
+                        st.error(f"Error building knowledge graph: {kg_result.get('message', 'Unknown error')}")
                 else:
-                    st.error(f"Error building knowledge graph: {kg_result.get('message', 'Unknown error')}")
-            else:
-                st.error(f"Failed to build knowledge graph: {kg_response.text}")
+                    st.error(f"Failed to build knowledge graph: {kg_response.text}")
                 
             process_state["kg_info"] = kg_info
     
@@ -413,7 +617,6 @@ elif st.session_state.page == 'incremental_analysis':
     if process_state["kg_info"] and process_state["kg_info"]["success"]:
         kg_info = process_state["kg_info"]
         
-        st.markdown("<div style='margin-bottom: 30px;'></div>", unsafe_allow_html=True)
         st.subheader("Knowledge Graph")
         st.write(f"🧠 **Nodes Added:** Comments: {kg_info['node_counts'].get('comments', 0)}, "
                 f"Replies: {kg_info['node_counts'].get('replies', 0)}, "
@@ -424,13 +627,12 @@ elif st.session_state.page == 'incremental_analysis':
         elif kg_info["action"] == "updated":
             st.success("♻️ Knowledge graph updated with comments/replies.")
     
-    # When all processing is complete, save the discussion
-    if (process_state["topic"] and 
-        process_state["thread_data"] and 
-        process_state["grouped_comments"] and 
-        process_state["stance_summaries"] and 
-        process_state["stance_percentages"] and 
-        process_state["kg_info"]):
+    # When all processing is complete, save the discussion (only once)
+    if not process_state.get("_saved") and all(
+        process_state[key] for key in (
+            "topic", "thread_data", "grouped_comments", "stance_summaries", "stance_percentages", "kg_info"
+        )
+    ):
         
         # Store the complete discussion data
         complete_discussion = {
@@ -440,18 +642,24 @@ elif st.session_state.page == 'incremental_analysis':
             "grouped_comments": process_state["grouped_comments"],
             "stance_summaries": process_state["stance_summaries"],
             "stance_percentages": process_state["stance_percentages"],
-            "kg_info": process_state["kg_info"]
+            "kg_info": process_state["kg_info"],
+            "display_title": derive_display_title(process_state["topic"]),
+            "bar_html": stance_bar_html(process_state["stance_percentages"]),
+            "legend_html": stance_legend_html(process_state["stance_percentages"])
         }
         
         # Add to discussions if not already there
-        if all(d.get("url") != reddit_url for d in st.session_state.discussions):
+        existing_discussion = st.session_state.discussions_by_url.get(reddit_url)
+        if existing_discussion is None:
             st.session_state.discussions.append(complete_discussion)
         else:
-            # Update existing discussion
-            for i, disc in enumerate(st.session_state.discussions):
-                if disc.get("url") == reddit_url:
-                    st.session_state.discussions[i] = complete_discussion
-                    break
+            # Update existing discussion in place, keeping its sidebar position
+            st.session_state.discussions[st.session_state.discussions.index(existing_discussion)] = complete_discussion
+        st.session_state.discussions_by_url[reddit_url] = complete_discussion
+
+        # Persist it so the analysis survives server restarts and new sessions
+        save_discussion(reddit_url, complete_discussion)
+        process_state["_saved"] = True
         
 
 # Discussion View Page - for viewing saved discussions
@@ -478,39 +686,10 @@ elif st.session_state.page == 'discussion_view':
             st.write(thread_data['post']['selftext'])
             
         # Stance distribution visualization
-        bar_style = f"""
-            <div style="display: flex; width: 100%; height: 25px; 
-                        border-radius: 15px; overflow: hidden; 
-                        border: 2px solid #ddd; margin-bottom: 20px; box-shadow: 2px 2px 5px rgba(0,0,0,0.2);">
-                <div style="width: {stance_percentages['FOR']}%; background: linear-gradient(to right, #27ae60, #2ecc71);"></div>
-                <div style="width: {stance_percentages['NEUTRAL']}%; background: linear-gradient(to right, #f1c40f, #f39c12);"></div>
-                <div style="width: {stance_percentages['AGAINST']}%; background: linear-gradient(to right, #e74c3c, #c0392b);"></div>
-            </div>
-        """
-        st.markdown("<div style='margin-bottom: 30px;'></div>", unsafe_allow_html=True)
-        st.divider()
+        section_divider()
         st.subheader("📊 Stance Distribution")
-        st.markdown(bar_style, unsafe_allow_html=True)
-
-        legend_html = f"""
-            <div style="display: flex; align-items: center; gap: 15px;">
-                <div style="display: flex; align-items: center;">
-                    <div style="width: 15px; height: 15px; background-color: #2ecc71; border-radius: 3px; margin-right: 5px;"></div>
-                    <span><b>For:</b> {stance_percentages['FOR']:.0f}%</span>
-                </div>
-                <div style="display: flex; align-items: center;">
-                    <div style="width: 15px; height: 15px; background-color: #f1c40f; border-radius: 3px; margin-right: 5px;"></div>
-                    <span><b>Neutral:</b> {stance_percentages['NEUTRAL']:.0f}%</span>
-                </div>
-                <div style="display: flex; align-items: center;">
-                    <div style="width: 15px; height: 15px; background-color: #e74c3c; border-radius: 3px; margin-right: 5px;"></div>
-                    <span><b>Against:</b> {stance_percentages['AGAINST']:.0f}%</span>
-                </div>
-            </div>
-        """
-
-        st.markdown(legend_html, unsafe_allow_html=True)
-        st.markdown("<div style='margin-bottom: 30px;'></div>", unsafe_allow_html=True)
+        st.markdown(discussion.get("bar_html") or stance_bar_html(stance_percentages), unsafe_allow_html=True)
+        st.markdown(discussion.get("legend_html") or stance_legend_html(stance_percentages), unsafe_allow_html=True)
         st.divider()
 
         # Display argument summaries
@@ -530,36 +709,22 @@ elif st.session_state.page == 'discussion_view':
         # Display original comments
         with expander_col1:
             with st.expander("Original Favorable Comments", expanded=False):
-                for comment in grouped_comments["FOR"]:
-                    st.write(f"**{comment['author']}** ({comment['score']} points)")
-                    st.write(comment["body"])
-                    render_replies(comment["replies"])
-                    st.write("---")
+                st.markdown(comments_md(grouped_comments["FOR"]))
 
         with expander_col2:
             with st.expander("Original Opposing Comments", expanded=False):
-                for comment in grouped_comments["AGAINST"]:
-                    st.write(f"**{comment['author']}** ({comment['score']} points)")
-                    st.write(comment["body"])
-                    render_replies(comment["replies"])
-                    st.write("---")
+                st.markdown(comments_md(grouped_comments["AGAINST"]))
 
         if grouped_comments["NEUTRAL"]:
             with st.expander("🟨 Neutral Arguments", expanded=False):
                 st.markdown(stance_summaries["NEUTRAL"])
                 st.write("---")
-                for comment in grouped_comments["NEUTRAL"]:
-                    st.write(f"**{comment['author']}** ({comment['score']} points)")
-                    st.write(comment["body"])
-                    render_replies(comment["replies"])
-                    st.write("---")
+                st.markdown(comments_md(grouped_comments["NEUTRAL"]))
                     
-        st.markdown("<div style='margin-bottom: 30px;'></div>", unsafe_allow_html=True)
-        st.divider()
+        section_divider()
 
         # Display Knowledge Graph info if it was successful
         if kg_info.get("success", False):
-            st.markdown("<div style='margin-bottom: 30px;'></div>", unsafe_allow_html=True)
             st.subheader("Knowledge Graph")
             st.write(f"🧠 **Nodes Added:** Comments: {kg_info['node_counts'].get('comments', 0)}, "
                     f"Replies: {kg_info['node_counts'].get('replies', 0)}, "
@@ -0,0 +1,180 @@
+from openai import OpenAI
+from functools import lru_cache
+from typing import List, Optional
+import logging
+import json
+import time
+from backend.kg_creator import (
+    ExtractedArguments,
+    EXTRACTION_MAX_OUTPUT_TOKENS,
+    argument_cache_keys,
+    argument_cache_lock,
+    argument_extraction_prompt,
+    argument_stances,
+    create_knowledge_graph,
+    get_argument_cache,
+    is_trivial_text,
+    load_cached_arguments,
+    pack_extraction_items,
+    regroup_discussion,
+    store_cached_arguments
+)
+
+
+# Offline argument extraction through OpenAI's Batch API (half the token price, results within 24h).
+# Submitting a thread's texts and collecting the batch later fills the argument cache, so the
+# knowledge graph creation of that thread finds every argument already extracted.
+
+logger = logging.getLogger('batch_extract')
+
+# Submitted batches, kept next to the argument cache (the cache key of every item, by item id)
+# (the table is created on first use, not at import; always used with argument_cache_lock held)
+@lru_cache(maxsize=1)
+def get_batch_jobs():
+    argument_cache = get_argument_cache()
+    argument_cache.execute("CREATE TABLE IF NOT EXISTS batch_jobs (batch_id TEXT PRIMARY KEY, topic TEXT NOT NULL, keys TEXT NOT NULL, created_at REAL)")
+    argument_cache.commit()
+    return argument_cache
+
+# Chat roles of the LangChain message types used by the extraction prompt
+MESSAGE_ROLES = {"system": "system", "human": "user"}
+
+# Batches that finished without results to collect
+FINISHED_STATUSES = {"failed", "expired", "cancelled"}
+
+# Seconds between two checks of the submitted batches
+BATCH_POLL_INTERVAL = 60
+
+@lru_cache(maxsize=1)
+def get_openai_client():
+    return OpenAI()
+
+# Helper function that lists the bodies of every comment and (nested) reply of a thread
+def thread_texts(thread_data: dict) -> List[str]:
+    texts = []
+    pending = [
+        comment
+        for comments in thread_data["classified_comments"].values()
+        for comment in comments
+    ]
+    while pending:
+        item = pending.pop()
+        texts.append(item.get("body") or "")
+        pending.extend(item.get("replies", []))
+    return texts
+
+# Submits the thread's uncached texts as one batch; returns its ID (None if nothing is missing)
+def submit_batch(thread_data: dict) -> Optional[str]:
+    topic = thread_data['post'].get('title', 'Unknown Topic')
+    texts = [text for text in thread_texts(thread_data) if not is_trivial_text(text)]
+    keys = argument_cache_keys(texts, topic)
+    cached = load_cached_arguments(list(dict.fromkeys(keys)))
+
+    missing = {}
+    for key, text in zip(keys, texts):
+        if key not in cached:
+            missing.setdefault(key, text)
+    if not missing:
+        logger.info("Every argument is already cached - nothing to submit")
+        return None
+
+    # Same packing and prompt as the live extraction, one request per packed chunk
+    items = [{"id": str(i), "text": text} for i, text in enumerate(missing.values())]
+    lines = []
+    for n, chunk in enumerate(pack_extraction_items(items)):
+        messages = argument_extraction_prompt.format_messages(
+            items=json.dumps(chunk, ensure_ascii=False, separators=(",", ":")), topic=topic
+        )
+        lines.append(json.dumps({
+            "custom_id": str(n),
+            "method": "POST",
+            "url": "/v1/chat/completions",
+            "body": {
+                "model": "gpt-4o",
+                "temperature": 0,
+                "max_tokens": EXTRACTION_MAX_OUTPUT_TOKENS,
+                "response_format": {"type": "json_object"},
+                "messages": [{"role": MESSAGE_ROLES[message.type], "content": message.content} for message in messages]
+            }
+        }))
+
+    client = get_openai_client()
+    batch_file = client.files.create(file=("arguments.jsonl", "\n".join(lines).encode()), purpose="batch")
+    batch = client.batches.create(input_file_id=batch_file.id, endpoint="/v1/chat/completions", completion_window="24h")
+    with argument_cache_lock:
+        argument_cache = get_batch_jobs()
+        argument_cache.execute(
+            "INSERT INTO batch_jobs (batch_id, topic, keys, created_at) VALUES (?, ?, ?, ?)",
+            (batch.id, topic, json.dumps(list(missing)), time.time())
+        )
+        argument_cache.commit()
+
+    logger.info(f"Submitted batch {batch.id}: {len(missing)} texts in {len(lines)} requests")
+    return batch.id
+
+# Collects a finished batch into the argument cache; returns the batch status
+def collect_batch(batch_id: str) -> str:
+    client = get_openai_client()
+    batch = client.batches.retrieve(batch_id)
+    if batch.status != "completed" and batch.status not in FINISHED_STATUSES:
+        return batch.status
+
+    with argument_cache_lock:
+        argument_cache = get_batch_jobs()
+        row = argument_cache.execute("SELECT keys FROM batch_jobs WHERE batch_id = ?", (batch_id,)).fetchone()
+    if row is None:
+        logger.warning(f"Unknown batch: {batch_id}")
+        return batch.status
+    keys = json.loads(row[0])
+
+    # Items whose request failed stay uncached (the live extraction picks them up)
+    extracted = {}
+    if batch.status == "completed" and batch.output_file_id:
+        for line in client.files.content(batch.output_file_id).text.splitlines():
+            result = json.loads(line)
+            response = result.get("response") or {}
+            if response.get("status_code") != 200:
+                logger.warning(f"Batch request {result.get('custom_id')} failed: {result.get('error')}")
+                continue
+            try:
+                parsed = ExtractedArguments.model_validate_json(response["body"]["choices"][0]["message"]["content"])
+            except Exception as e:
+                logger.warning(f"Could not parse batch request {result.get('custom_id')}: {e}")
+                continue
+            for item in parsed.items:
+                if item.id.isdigit() and int(item.id) < len(keys):
+                    extracted[keys[int(item.id)]] = argument_stances(item)
+
+    store_cached_arguments(list(extracted.items()))
+
+    with argument_cache_lock:
+        argument_cache = get_batch_jobs()
+        argument_cache.execute("DELETE FROM batch_jobs WHERE batch_id = ?", (batch_id,))
+        argument_cache.commit()
+
+    logger.info(f"Collected batch {batch_id} ({batch.status}): {len(extracted)} of {len(keys)} texts cached")
+    return batch.status
+
+# Builds the knowledge graph of many threads, extracting their arguments through the Batch API first
+# (blocks until every batch has finished, so it is meant for offline/bulk ingestion, not requests)
+def bulk_process_threads(threads: List[dict], poll_interval: int = BATCH_POLL_INTERVAL) -> List[dict]:
+    pending = {batch_id for batch_id in map(submit_batch, threads) if batch_id}
+    while pending:
+        for batch_id in list(pending):
+            status = collect_batch(batch_id)
+            if status == "completed" or status in FINISHED_STATUSES:
+                pending.discard(batch_id)
+        if pending:
+            logger.info(f"Waiting for {len(pending)} batches")
+            time.sleep(poll_interval)
+
+    # Every argument is cached now, so building the graphs only calls the LLM to regroup
+    # (and for texts whose batch request failed); there is no request to return early from,
+    # so each thread is regrouped right away
+    results = []
+    for thread_data in threads:
+        result = create_knowledge_graph(thread_data)
+        if result["needs_regroup"]:
+            regroup_discussion(result["discussion_id"])
+        results.append(result)
+    return results
\ No newline at end of file
@@ -2,11 +2,22 @@ from neo4j import GraphDatabase
 import os
 import uuid
 from dotenv import load_dotenv
-from langchain.prompts import PromptTemplate
+from langchain.prompts import ChatPromptTemplate
 from langchain_openai import ChatOpenAI
+from langchain_core.messages import SystemMessage
 from pydantic import BaseModel
-from typing import Any, Dict, List, Tuple
+from typing import Any, Dict, List, Literal, Tuple
 import logging
+import json
+import re
+import sqlite3
+import hashlib
+import threading
+import time
+import tiktoken
+from functools import lru_cache
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
 
 
 # Load environment variables
@@ -14,24 +25,100 @@ load_dotenv()
 
 logger = logging.getLogger('kg_creator')
 
-# Initialize Neo4j driver
-driver = None
-try:
+# Database every session uses (naming it skips the home database lookup)
+NEO4J_DATABASE = os.getenv("NEO4J_DATABASE", "neo4j")
+
+# Constraints backing every MERGE key, so merges use an index instead of a label scan
+SCHEMA_STATEMENTS = [
+    "CREATE CONSTRAINT topic_url IF NOT EXISTS FOR (t:Topic) REQUIRE t.url IS UNIQUE",
+    "CREATE CONSTRAINT comment_id IF NOT EXISTS FOR (c:Comment) REQUIRE (c.id, c.discussion_id) IS UNIQUE",
+    "CREATE CONSTRAINT reply_id IF NOT EXISTS FOR (r:Reply) REQUIRE (r.id, r.discussion_id) IS UNIQUE",
+    "DROP CONSTRAINT argument_text IF EXISTS",
+    "CREATE CONSTRAINT argument_key IF NOT EXISTS FOR (a:Argument) REQUIRE (a.key, a.discussion_id) IS UNIQUE",
+    # (argument groups were only indexed at first; the constraint brings its own index)
+    "DROP INDEX argument_group_key IF EXISTS",
+    "CREATE CONSTRAINT argument_group_unique IF NOT EXISTS FOR (g:ArgumentGroup) REQUIRE (g.summary, g.stance, g.discussion_id) IS UNIQUE",
+    # Whole-discussion lookups (regrouping, evaluation page) filter by discussion_id alone,
+    # which the composite keys above can't serve
+    "CREATE INDEX topic_discussion IF NOT EXISTS FOR (t:Topic) ON (t.discussion_id)",
+    "CREATE INDEX comment_discussion IF NOT EXISTS FOR (c:Comment) ON (c.discussion_id)",
+    "CREATE INDEX reply_discussion IF NOT EXISTS FOR (r:Reply) ON (r.discussion_id)",
+    "CREATE INDEX argument_discussion IF NOT EXISTS FOR (a:Argument) ON (a.discussion_id)",
+    # Per-stance argument lookups (regrouping, stance counts) and the Explore page,
+    # which finds a discussion by its topic title
+    "CREATE INDEX argument_stance IF NOT EXISTS FOR (a:Argument) ON (a.discussion_id, a.stance)",
+    "CREATE INDEX topic_title IF NOT EXISTS FOR (t:Topic) ON (t.title)"
+]
+
+# Helper function that builds the fixed-width key arguments are merged by
+# (memoized: the same texts are keyed again when they are grouped)
+@lru_cache(maxsize=65536)
+def argument_key(text: str) -> str:
+    return hashlib.blake2b(text.encode(), digest_size=16).hexdigest()
+
+# Give arguments stored before hashed keys existed their key
+def backfill_argument_keys(tx):
+    result = tx.run("MATCH (a:Argument) WHERE a.key IS NULL RETURN elementId(a) AS id, a.text AS text")
+    rows = [{"id": record["id"], "key": argument_key(record["text"])} for record in result if record["text"]]
+    tx.run("""
+        UNWIND $rows AS row
+        MATCH (a:Argument) WHERE elementId(a) = row.id
+        SET a.key = row.key
+    """, rows=rows)
+
+# Initialize Neo4j driver on first use, not at import (so importing never opens a connection);
+# a failed connection raises and isn't cached, so the next request tries again
+@lru_cache(maxsize=1)
+def connect_neo4j():
     driver = GraphDatabase.driver(
         os.getenv("NEO4J_URI"),
-        auth=(os.getenv("NEO4J_USER"), os.getenv("NEO4J_PASSWORD"))
+        auth=(os.getenv("NEO4J_USER"), os.getenv("NEO4J_PASSWORD")),
+        max_connection_pool_size=50,
+        connection_acquisition_timeout=60,
+        # Fail fast on an unreachable server, and bound how long execute_write retries
+        # transient errors
+        connection_timeout=30,
+        max_transaction_retry_time=15,
+        max_connection_lifetime=3600,
+        keep_alive=True
     )
-    # Test the connection by running a dummy query
-    with driver.session() as session:
-        session.run("RETURN 1")
+    # Test the connection
+    try:
+        driver.verify_connectivity()
+    except Exception as e:
+        logger.error(f"Failed to connect to Neo4j: {e}")
+        driver.close()
+        raise
     logger.info("Successfully connected to Neo4j")
-except Exception as e:
-    logger.error(f"Failed to connect to Neo4j: {e}")
+
+    with driver.session(database=NEO4J_DATABASE) as session:
+        for statement in SCHEMA_STATEMENTS:
+            try:
+                session.run(statement).consume()
+            except Exception as e:
+                logger.warning(f"Could not apply schema statement '{statement}': {e}")
+        try:
+            session.execute_write(backfill_argument_keys)
+        except Exception as e:
+            logger.warning(f"Could not backfill argument keys: {e}")
+    return driver
+
+# Concurrent first requests wait for a single connection instead of opening one each
+driver_lock = threading.Lock()
+
+def get_driver():
+    with driver_lock:
+        return connect_neo4j()
+
+# Retries of a rate-limited (429) or failed OpenAI request; the client backs off between them,
+# honouring Retry-After, so bursts of concurrent calls slow down instead of failing
+OPENAI_MAX_RETRIES = 6
 
 # Initialize OpenAI model
 llm = ChatOpenAI(
     model="gpt-4o",
     temperature=0,
+    max_retries=OPENAI_MAX_RETRIES,
     openai_api_key=os.getenv("OPENAI_API_KEY")
 )
 
@@ -42,99 +129,231 @@ STANCE_MAP = {
     "NEUTRAL": "NEUTRAL"
 }
 
-# Prompt to extract arguments
-argument_extraction_prompt = PromptTemplate(
-    input_variables=["text", "topic"],
-    template="""
-    You are an AI trained to extract formal, self-contained, **non-redundant arguments** from Reddit discussions.
+# Merges a thread's topic, comments and replies in one query (one round-trip per thread):
+# - the topic keeps the discussion ID of a thread that was already stored
+# - new comments are linked to the topic, with the relationship type of their stance chosen
+#   per row (so the text never changes); new replies to their parent comment or reply
+# - bodies are only rewritten when their hash differs
+# - the IDs of new comments and replies are returned, and the IDs and element IDs of new or edited ones
+# - new or edited content flags the topic for regrouping (kept until a regroup succeeds, so a
+#   crash before it runs doesn't lose the signal)
+THREAD_NODES_QUERY = """
+    MERGE (t:Topic {url: $url})
+    SET t.title = $title,
+        t.discussion_id = coalesce(t.discussion_id, $discussion_id),
+        t.updated_at = datetime()
+    WITH t, t.discussion_id AS discussion_id
+    CALL {
+        WITH t, discussion_id
+        UNWIND $comments AS comment
+        MERGE (c:Comment {id: comment.id, discussion_id: discussion_id})
+        ON CREATE SET c.is_new = true
+        WITH t, c, comment, coalesce(c.is_new, false) AS created,
+             coalesce(c.body_hash, "") <> comment.body_hash AS changed
+        REMOVE c.is_new
+        SET c.author = comment.author, c.score = comment.score, c.updated_at = datetime()
+        FOREACH (_ IN CASE WHEN changed THEN [1] ELSE [] END | SET c.body = comment.body, c.body_hash = comment.body_hash)
+""" + "".join(
+    f"""        FOREACH (_ IN CASE WHEN created AND comment.stance = "{stance}" THEN [1] ELSE [] END | MERGE (c)-[:{relationship}]->(t))
+"""
+    for stance, relationship in STANCE_MAP.items()
+) + """        RETURN collect(CASE WHEN created THEN c.id END) AS new_comment_ids,
+               collect(CASE WHEN changed THEN [c.id, elementId(c)] END) AS changed_comments
+    }
+    CALL {
+        WITH discussion_id
+        UNWIND $replies AS reply
+        MERGE (r:Reply {id: reply.id, discussion_id: discussion_id})
+        ON CREATE SET r.is_new = true
+        WITH discussion_id, r, reply, coalesce(r.is_new, false) AS created,
+             coalesce(r.body_hash, "") <> reply.body_hash AS changed
+        REMOVE r.is_new
+        SET r.author = reply.author,
+            r.score = reply.score,
+            r.parent_comment_id = reply.parent_comment_id,
+            r.updated_at = datetime()
+        FOREACH (_ IN CASE WHEN changed THEN [1] ELSE [] END | SET r.body = reply.body, r.body_hash = reply.body_hash)
+        WITH discussion_id, r, reply, created, changed
+        OPTIONAL MATCH (c:Comment {id: reply.parent_id, discussion_id: discussion_id}) WHERE created
+        OPTIONAL MATCH (p:Reply {id: reply.parent_id, discussion_id: discussion_id}) WHERE created
+        WITH r, created, changed, coalesce(c, p) AS parent
+        FOREACH (_ IN CASE WHEN parent IS NULL THEN [] ELSE [1] END | MERGE (r)-[:REPLY_TO]->(parent))
+        RETURN collect(CASE WHEN created THEN r.id END) AS new_reply_ids,
+               collect(CASE WHEN changed THEN [r.id, elementId(r)] END) AS changed_replies
+    }
+    SET t.needs_regroup = coalesce(t.needs_regroup, false) OR size(changed_comments) > 0 OR size(changed_replies) > 0
+    RETURN discussion_id, new_comment_ids, changed_comments, new_reply_ids, changed_replies, t.needs_regroup AS needs_regroup
+"""
+
+# Maximum number of argument rows sent in a single UNWIND write
+ARGUMENT_BATCH_SIZE = 1000
+
+# Maximum number of concurrent OpenAI requests while extracting arguments
+EXTRACTION_CONCURRENCY = 20
+
+# Number of comments/replies sent together in one argument extraction call
+EXTRACTION_BATCH_SIZE = 10
+
+# Number of comments/replies extracted while the arguments of the previous ones are written
+# (enough to keep every concurrent extraction call busy)
+EXTRACTION_SLICE_SIZE = EXTRACTION_CONCURRENCY * EXTRACTION_BATCH_SIZE
+
+# Maximum number of text tokens packed into one argument extraction call
+EXTRACTION_TOKEN_BUDGET = 6000
+
+# Tokenizer loaded on first use, not at import (loading it may download the encoding)
+@lru_cache(maxsize=1)
+def get_encoding():
+    return tiktoken.encoding_for_model("gpt-4o")
+
+# Longer comments/replies are clipped (arguments show up early, and one huge post
+# shouldn't dominate the cost of a thread), and extraction answers are capped
+MAX_TEXT_TOKENS = 1024
+EXTRACTION_MAX_OUTPUT_TOKENS = 2048
+
+# Comments/replies too short or generic to hold an argument skip the LLM entirely
+MIN_ARGUMENT_WORDS = 5
+TRIVIAL_TEXT = re.compile(r"^\W*(?:\[deleted\]|\[removed\]|l+o+l+|this|\^+|\+1|thanks?|thank you|same|agreed?|yes|no)\W*$", re.IGNORECASE)
+
+# Persistent cache of extracted arguments, keyed by BLAKE2b of (prompt version, topic, text),
+# and of argument groupings, keyed by BLAKE2b of (prompt version, stance, arguments)
+# (opened on first use, not at import, like the Neo4j driver; always used with the lock held)
+argument_cache_lock = threading.Lock()
+
+@lru_cache(maxsize=1)
+def get_argument_cache():
+    argument_cache = sqlite3.connect(os.getenv("ARGUMENT_CACHE_PATH", "argument_cache.db"), check_same_thread=False)
+    argument_cache.execute("CREATE TABLE IF NOT EXISTS arg_cache (key TEXT PRIMARY KEY, arguments TEXT NOT NULL, created_at REAL)")
+    argument_cache.execute("CREATE TABLE IF NOT EXISTS grouping_cache (key TEXT PRIMARY KEY, content TEXT NOT NULL, created_at REAL)")
+    # Caches created before entries expired have no created_at column yet
+    if "created_at" not in [column[1] for column in argument_cache.execute("PRAGMA table_info(arg_cache)")]:
+        argument_cache.execute("ALTER TABLE arg_cache ADD COLUMN created_at REAL")
+    return argument_cache
+
+# How long cached arguments are reused before being extracted again (seconds)
+ARGUMENT_CACHE_TTL = 30 * 24 * 60 * 60
+
+# In-memory LRU in front of arg_cache (same keys, with the time each entry was cached),
+# so re-ingesting a thread in the same process doesn't go back to SQLite
+RECENT_ARGUMENTS_SIZE = 10_000
+recent_arguments = OrderedDict()
+
+# Part of every cache key: bump when the extraction/stance or grouping prompt changes,
+# so answers to the old prompt are no longer reused
+EXTRACTION_PROMPT_VERSION = "3"
+GROUPING_PROMPT_VERSION = "3"
+
+# Structured output of the argument extraction chain (each argument with its stance)
+class ExtractedArgument(BaseModel):
+    text: str
+    stance: Literal["FOR", "AGAINST", "NEUTRAL"]
+
+class ItemArguments(BaseModel):
+    id: str
+    arguments: List[ExtractedArgument]
+
+class ExtractedArguments(BaseModel):
+    items: List[ItemArguments]
+
+# Structured output of the argument grouping chain
+class ArgumentGroup(BaseModel):
+    summary: str
+    arguments: List[str]
+
+class GroupedArguments(BaseModel):
+    groups: List[ArgumentGroup]
+
+# Prompt to extract arguments (many texts per call, answered as JSON)
+# (the instructions and examples form a literal system message over 1024 tokens, never re-rendered,
+# with the topic and items last, so OpenAI caches the shared prefix across every extraction call)
+EXTRACTION_INSTRUCTIONS = """
+    You are an AI trained to extract formal, self-contained, **non-redundant arguments** from Reddit discussions,
+    and to classify the stance of each one toward the discussion topic.
 
     Your task is to extract only arguments that can be used in scientific, academic, or logical contexts. 
     Arguments should clearly support or oppose a specific claim related to the discussion topic. 
     Avoid insults, and vague statements.
 
     ### INSTRUCTIONS:
+    - You receive a JSON list of items, each with an "id" and a "text". Extract arguments from each text separately.
     - Extract arguments that include **reasoning, causal relationships, or factual claims**.
     - Each argument must be **self-contained**: don't use pronouns like "this" or "it" without defining them.
     - **Avoid repeating the same idea** in different words.
     - Do **not** extract vague, general statements or insults.
-    - If no clear arguments exist, return: **"No clear arguments found."**
+    - If a text has no clear arguments, return an empty list of arguments for its id.
+    - Give each argument the stance it expresses toward the topic (consider implicit meanings and nuances too):
+      - FOR: the argument expresses clear or implicit support for the topic.
+      - AGAINST: the argument expresses clear or implicit opposition to the topic.
+      - NEUTRAL: the argument neither supports nor opposes the topic, or is ambiguous.
 
     ### EXAMPLES:
 
     Topic: "Should schools ban smartphones?"
-    Text:
-    Parents that give kids smarthphones are stupid. Smartphones distract students from learning.  
-    Kids use them during class to cheat on tests.  
-    Smartphones allow students to stay connected with parents in emergencies.
+    Items:
+    [{"id": "0", "text": "Parents that give kids smarthphones are stupid. Smartphones distract students from learning. Kids use them during class to cheat on tests. Smartphones allow students to stay connected with parents in emergencies."}, {"id": "1", "text": "lol ok"}]
 
     Output:
-    1. Smartphones distract students from learning.
-    2. Students use smartphones to cheat during exams.
-    3. Smartphones can help students stay in touch with parents during emergencies.
+    {"items": [{"id": "0", "arguments": [{"text": "Smartphones distract students from learning.", "stance": "FOR"}, {"text": "Students use smartphones to cheat during exams.", "stance": "FOR"}, {"text": "Smartphones can help students stay in touch with parents during emergencies.", "stance": "AGAINST"}]}, {"id": "1", "arguments": []}]}
 
     ---
 
     Topic: "Is Trump a threat to democracy?"
-    Text:
-    Trump is very stupid.  
-    Trump is cunning and wants revenge.  
-    He pressures officials to do what he wants.  
-    Trump uses his power to discredit investigations.
+    Items:
+    [{"id": "0", "text": "Trump is very stupid. Trump is cunning and wants revenge. He pressures officials to do what he wants. Trump uses his power to discredit investigations."}]
 
     Output:
-    1. Trump has pressured government officials to influence investigations.
-    2. Trump has used his power to discredit investigations and investigators.
-    3. Trump seeks to consolidate power for personal gain, undermining democratic norms.
+    {"items": [{"id": "0", "arguments": [{"text": "Trump has pressured government officials to influence investigations.", "stance": "FOR"}, {"text": "Trump has used his power to discredit investigations and investigators.", "stance": "FOR"}, {"text": "Trump seeks to consolidate power for personal gain, undermining democratic norms.", "stance": "FOR"}]}]}
 
     ---
 
-    ### Now extract arguments for the following post:
-
-    Reddit Topic: "{topic}"
+    Topic: "Should the minimum wage be raised to $20 an hour?"
+    Items:
+    [{"id": "0", "text": "Oh sure, let's raise it to $20 and watch every small diner in my town close. Labor is already their biggest cost and they run on thin margins."}, {"id": "1", "text": "Anyone who disagrees is a corporate bootlicker."}, {"id": "2", "text": "Rent has doubled here in ten years while wages barely moved. A full-time worker can't afford a one-bedroom apartment on the current minimum wage. Higher wages also mean more spending at local businesses."}]
 
-    Content:
-    {text}
+    Output:
+    {"items": [{"id": "0", "arguments": [{"text": "Raising the minimum wage to $20 could force small restaurants to close, because labor is their largest cost and their profit margins are thin.", "stance": "AGAINST"}]}, {"id": "1", "arguments": []}, {"id": "2", "arguments": [{"text": "Rents have risen much faster than minimum wages, so a full-time minimum wage worker cannot afford a one-bedroom apartment.", "stance": "FOR"}, {"text": "Higher minimum wages increase consumer spending at local businesses.", "stance": "FOR"}]}]}
 
-    Only output a numbered list of arguments, or "No clear arguments found."
-    """
-)
+    ---
 
-# Build the argument extraction chain
-argument_chain = argument_extraction_prompt | llm
+    Topic: "Should nuclear power replace coal plants?"
+    Items:
+    [{"id": "0", "text": "Nuclear produces almost no CO2 while running. It's also way more reliable than wind or solar since it doesn't depend on the weather. That said, the waste stays dangerous for thousands of years and nobody wants it stored near them."}, {"id": "1", "text": "Chernobyl. Enough said."}, {"id": "2", "text": "Building a new reactor takes 10-15 years and usually goes billions over budget, so it's too slow to fix the climate problem."}]
 
-# Prompt to classify arguments
-stance_classification_prompt = PromptTemplate(
-    input_variables=["argument", "topic"],
-    template="""
-    You are given the Reddit discussion topic:
-    "{topic}"
+    Output:
+    {"items": [{"id": "0", "arguments": [{"text": "Nuclear power plants emit almost no carbon dioxide during operation.", "stance": "FOR"}, {"text": "Nuclear power is more reliable than wind or solar power because its output does not depend on the weather.", "stance": "FOR"}, {"text": "Nuclear waste remains dangerous for thousands of years and communities resist storing it nearby.", "stance": "AGAINST"}]}, {"id": "1", "arguments": [{"text": "The Chernobyl disaster shows that nuclear accidents can be catastrophic.", "stance": "AGAINST"}]}, {"id": "2", "arguments": [{"text": "New nuclear reactors take 10 to 15 years to build and often exceed their budgets by billions, making them too slow to address climate change.", "stance": "AGAINST"}]}]}
 
-    Classify the stance expressed in the following argument with one of these labels: FOR, AGAINST, or NEUTRAL.
+    Return every item id with its list of arguments and their stances.
+    """
 
-    Argument:
-    "{argument}"
+argument_extraction_prompt = ChatPromptTemplate.from_messages([
+    SystemMessage(content=EXTRACTION_INSTRUCTIONS),
+    ("human", """
+    ### Now extract and classify arguments for the following items:
 
-    Instructions:
-    - FOR: The argument expresses clear or implicit support for the topic.
-    - AGAINST: The argument expresses clear or implicit opposition to the topic.
-    - NEUTRAL: The argument neither supports nor opposes the topic, or is ambiguous.
+    Reddit Topic: "{topic}"
 
-    Consider the overall position conveyed, including implicit meanings or nuances, not only explicit statements.
+    Items:
+    {items}
+    """)
+])
 
-    Return exactly one word: FOR, AGAINST, or NEUTRAL.
-    """
+# Build the argument extraction chain (returns a parsed ExtractedArguments)
+extraction_llm = ChatOpenAI(
+    model="gpt-4o",
+    temperature=0,
+    max_tokens=EXTRACTION_MAX_OUTPUT_TOKENS,
+    max_retries=OPENAI_MAX_RETRIES,
+    openai_api_key=os.getenv("OPENAI_API_KEY")
 )
-
-stance_classifier = stance_classification_prompt | llm
+argument_chain = argument_extraction_prompt | extraction_llm.with_structured_output(ExtractedArguments)
 
 #Prompt to create argument clusters
-argument_grouping_prompt = PromptTemplate(
-    input_variables=["stance", "arguments"],
-    template="""
+# (static instructions as a literal system message, then the stance and its arguments)
+GROUPING_INSTRUCTIONS = """
     You are an AI system trained to group semantically similar arguments from Reddit discussions.
 
     ### Objective:
-    Given a list of arguments that all share the same stance ("{stance}") toward a topic, group those that express the same specific idea — even if they use different wording. 
+    Given a list of arguments that all share the same stance toward a topic, group those that express the same specific idea — even if they use different wording. 
     For each group, write a **detailed and self-contained summary** that explains the **shared claim** and the **main reasoning** behind it.
 
     ### Instructions:
@@ -148,49 +367,207 @@ argument_grouping_prompt = PromptTemplate(
 
     ### Format:
 
-    Group: <detailed explanation of the shared argument and reasoning>
-    - <original argument 1>
-    - <original argument 2>
+    Return a JSON object with a list of groups. Each group has a "summary" (the detailed
+    explanation of the shared argument and reasoning) and its "arguments" (the original
+    arguments, copied exactly, without the leading "- "):
 
-    Group: <another detailed explanation>
-    - <original argument 3>
+    {"groups": [{"summary": "<detailed explanation>", "arguments": ["<original argument 1>", "<original argument 2>"]}, {"summary": "<another detailed explanation>", "arguments": ["<original argument 3>"]}]}
+    """
+
+argument_grouping_prompt = ChatPromptTemplate.from_messages([
+    SystemMessage(content=GROUPING_INSTRUCTIONS),
+    ("human", """
+    ### Stance: {stance}
 
     ### Arguments:
     {arguments}
-    """
-)
+    """)
+])
 
-argument_grouping_chain = argument_grouping_prompt | llm
+# Build the argument grouping chain (returns a parsed GroupedArguments)
+argument_grouping_chain = argument_grouping_prompt | llm.with_structured_output(GroupedArguments)
 
 # Pydantic model
 class KGRequest(BaseModel):
     thread_data: Dict[str, Any]
 
-# Extrai argumentos e classifica a stance de cada um
-def extract_and_classify_arguments(text: str, topic: str) -> List[Tuple[str, str]]:
-    response = argument_chain.invoke({"text": text, "topic": topic})
-    content = response.content.strip()
+# Helper function that collapses runs of whitespace, so spacing never makes a different argument
+def normalize_whitespace(text: str) -> str:
+    return " ".join(text.split())
 
-    if "No clear arguments found" in content:
-        return []
+# Helper function that fingerprints a comment/reply body, so unchanged bodies aren't rewritten
+def body_hash(body: str) -> str:
+    return hashlib.blake2b((body or "").encode(), digest_size=16).hexdigest()
 
-    extracted = [line.split(" ", 1)[-1].strip() for line in content.split('\n') if line.strip()]
-    result = []
+# Helper function that builds the row a comment/reply is merged from
+# (missing values get a default of the same type, so every row has the same shape and types)
+def node_row(item: dict, **fields) -> Dict[str, Any]:
+    body = item.get("body") or ""
+    return {
+        "id": item["id"],
+        "body": body,
+        "body_hash": body_hash(body),
+        "author": item.get("author") or "",
+        "score": int(item.get("score") or 0),
+        **fields
+    }
 
-    for arg in extracted:
-        stance_resp = stance_classifier.invoke({"argument": arg, "topic": topic})
-        stance = stance_resp.content.strip().upper()
-        if stance in ["FOR", "AGAINST", "NEUTRAL"]:
-            result.append((arg, stance))
-        else:
-            logger.warning(f"Invalid stance returned for argument: {arg} -> {stance}")
+# Helper function that tells whether a comment/reply is too trivial to hold an argument
+def is_trivial_text(text: str) -> bool:
+    return len(text.split()) < MIN_ARGUMENT_WORDS or bool(TRIVIAL_TEXT.match(text))
+
+# Helper function that builds the argument cache keys of many texts of the same topic
+# (the prompt version and topic prefix is hashed once and the hasher state copied for each text)
+def argument_cache_keys(texts: List[str], topic: str) -> List[str]:
+    prefix = hashlib.blake2b(f"{EXTRACTION_PROMPT_VERSION}\0{topic}\0".encode(), digest_size=16)
+    keys = []
+    for text in texts:
+        hasher = prefix.copy()
+        hasher.update(text.strip().encode())
+        keys.append(hasher.hexdigest())
+    return keys
+
+# Returns the cached arguments of the given keys that haven't expired
+# (looked up in chunks below SQLite's parameter limit)
+def load_cached_arguments(keys: List[str]) -> Dict[str, List[Tuple[str, str]]]:
+    cached = {}
+    now = time.time()
+    with argument_cache_lock:
+        for key in keys:
+            recent = recent_arguments.get(key)
+            if recent is not None and recent[0] >= now - ARGUMENT_CACHE_TTL:
+                recent_arguments.move_to_end(key)
+                cached[key] = recent[1]
+        keys = [key for key in keys if key not in cached]
+
+        for start in range(0, len(keys), 500):
+            chunk = keys[start:start + 500]
+            rows = get_argument_cache().execute(
+                f"SELECT key, arguments, created_at FROM arg_cache WHERE key IN ({','.join('?' * len(chunk))}) AND created_at >= ?",
+                [*chunk, now - ARGUMENT_CACHE_TTL]
+            ).fetchall()
+            for key, arguments, created_at in rows:
+                cached[key] = [tuple(arg) for arg in json.loads(arguments)]
+                remember_arguments(key, created_at, cached[key])
+    return cached
+
+def store_cached_arguments(entries: List[Tuple[str, List[Tuple[str, str]]]]):
+    now = time.time()
+    rows = [(key, json.dumps(result), now) for key, result in entries]
+    with argument_cache_lock:
+        argument_cache = get_argument_cache()
+        argument_cache.executemany("INSERT OR REPLACE INTO arg_cache (key, arguments, created_at) VALUES (?, ?, ?)", rows)
+        argument_cache.commit()
+        for key, result in entries:
+            remember_arguments(key, now, [tuple(arg) for arg in result])
+
+# Helper function that keeps an entry in the in-memory LRU, evicting the least recently used
+# (called with argument_cache_lock held)
+def remember_arguments(key: str, created_at: float, arguments: List[Tuple[str, str]]):
+    recent_arguments[key] = (created_at, arguments)
+    recent_arguments.move_to_end(key)
+    if len(recent_arguments) > RECENT_ARGUMENTS_SIZE:
+        recent_arguments.popitem(last=False)
+
+# Extrai argumentos de vários textos, reaproveitando os que já estão em cache
+# (also returns the positions of texts whose extraction failed, which get no arguments)
+def extract_and_classify_arguments(texts: List[str], topic: str) -> Tuple[List[List[Tuple[str, str]]], set]:
+    keys = argument_cache_keys(texts, topic)
+    unique_keys = list(dict.fromkeys(keys))
+
+    # Trivial texts get no arguments, without asking the cache or the LLM
+    cached = {key: [] for key, text in zip(keys, texts) if is_trivial_text(text)}
+    trivial_count = len(cached)
+
+    # Look up every other key at once
+    unique_keys = [key for key in unique_keys if key not in cached]
+    cached.update(load_cached_arguments(unique_keys))
+
+    # Only texts never seen before (and each duplicate only once) reach the LLM
+    missing = {}
+    for key, text in zip(keys, texts):
+        if key not in cached:
+            missing.setdefault(key, text)
+    failed_keys = set()
+    if missing:
+        logger.info(f"Argument cache: {len(unique_keys) - len(missing)} hits, {len(missing)} misses, {trivial_count} trivial")
+        fresh, failed = run_argument_extraction(list(missing.values()), topic)
+        store_cached_arguments([(key, result) for i, (key, result) in enumerate(zip(missing, fresh)) if i not in failed])
+        cached.update(zip(missing, fresh))
+        failed_keys = {key for i, key in enumerate(missing) if i in failed}
+
+    return [cached[key] for key in keys], {i for i, key in enumerate(keys) if key in failed_keys}
+
+# Helper function that packs items into extraction calls, bounded by count and by tokens
+# (texts over MAX_TEXT_TOKENS are clipped first)
+def pack_extraction_items(items: List[Dict[str, str]]) -> List[List[Dict[str, str]]]:
+    encoding = get_encoding()
+    chunks = []
+    chunk = []
+    used = 0
+    for item, tokens in zip(items, encoding.encode_batch([item["text"] for item in items])):
+        if len(tokens) > MAX_TEXT_TOKENS:
+            tokens = tokens[:MAX_TEXT_TOKENS]
+            item["text"] = encoding.decode(tokens)
+        if chunk and (len(chunk) == EXTRACTION_BATCH_SIZE or used + len(tokens) > EXTRACTION_TOKEN_BUDGET):
+            chunks.append(chunk)
+            chunk = []
+            used = 0
+        chunk.append(item)
+        used += len(tokens)
+    if chunk:
+        chunks.append(chunk)
+    return chunks
+
+# Extrai argumentos de vários textos (em paralelo), já com a stance de cada um
+# (also returns the positions of texts where an LLM call failed, so they are not cached and
+# create_knowledge_graph marks their comments/replies for extraction on the next ingest)
+def run_argument_extraction(texts: List[str], topic: str) -> Tuple[List[List[Tuple[str, str]]], set]:
+    config = {"max_concurrency": EXTRACTION_CONCURRENCY}
+
+    # Several texts go in each extraction call, identified by their position
+    items = [{"id": str(i), "text": text} for i, text in enumerate(texts)]
+    chunks = pack_extraction_items(items)
+    # (compact JSON, since every separator space would be a prompt token)
+    responses = argument_chain.batch(
+        [{"items": json.dumps(chunk, ensure_ascii=False, separators=(",", ":")), "topic": topic} for chunk in chunks],
+        config=config,
+        return_exceptions=True
+    )
 
-    return result
+    extracted = [[] for _ in texts]
+    failed = set()
+    for chunk, response in zip(chunks, responses):
+        if isinstance(response, Exception):
+            logger.warning(f"Argument extraction failed: {response}")
+            failed.update(int(item["id"]) for item in chunk)
+            continue
+        # (an item the answer left out, or gave an unknown id, counts as failed instead of
+        # being cached as having no arguments)
+        chunk_ids = {item["id"] for item in chunk}
+        returned = set()
+        for item in response.items:
+            if item.id in chunk_ids:
+                extracted[int(item.id)] = argument_stances(item)
+                returned.add(item.id)
+        failed.update(int(item_id) for item_id in chunk_ids - returned)
+
+    return extracted, failed
+
+# Helper function that lists an extracted item's (argument, stance) pairs
+# (whitespace is normalized once, here: cached and written arguments reuse this text)
+def argument_stances(item: ItemArguments) -> List[Tuple[str, str]]:
+    return [
+        (text, argument.stance)
+        for argument in item.arguments
+        for text in [normalize_whitespace(argument.text)]
+        if text
+    ]
 
 # Debug function to see what's in the database
 def debug_existing_content(discussion_id):
     """Debug function to see what content exists in the database"""
-    with driver.session() as session:
+    with get_driver().session(database=NEO4J_DATABASE) as session:
         # Check comments
         comment_result = session.run("""
             MATCH (c:Comment {discussion_id: $discussion_id})
@@ -216,256 +593,384 @@ def create_knowledge_graph(thread_data: dict) -> dict:
     # Get post title and URL (used as unique discussion ID)
     topic_title = thread_data['post'].get('title', 'Unknown Topic')
     thread_url = thread_data['post'].get('url', 'unknown')
-    comment_count = 0
-    reply_count = 0
-    argument_count = 0
-    new_content_added = False  # Track if any new content was added
-
-    with driver.session() as session:
-        # Check if the thread already exists in the graph
-        existing = session.execute_read(check_existing_discussion_by_url, thread_url)
-        # Ensure the topic node is present in the graph
-        discussion_id = existing if existing else str(uuid.uuid4())
-        session.execute_write(merge_topic, topic_title, discussion_id, thread_url)
-
-        # Debug: Show what exists before processing
-        logger.info(f"Processing discussion: {discussion_id}")
-        debug_existing_content(discussion_id)
-
-        # Loop through each stance category: FOR, AGAINST, NEUTRAL
-        for stance in ["FOR", "AGAINST", "NEUTRAL"]:
-            for i, comment in enumerate(thread_data["classified_comments"].get(stance, [])):
-                # Ensure each comment has a unique ID - use original Reddit ID
-                original_comment_id = comment.get("id", "")
-                if not original_comment_id:
-                    comment["id"] = f"comment_{stance}_{i}"
-                else:
-                    comment["id"] = original_comment_id
-                    
-                comment.update({"discussion_id": discussion_id})
-
-                # Check if the comment is already in the database
-                comment_exists = session.execute_read(check_comment_exists, comment["id"], discussion_id)
-                logger.info(f"Comment {comment['id']} exists: {comment_exists}")
-                
-                session.execute_write(merge_comment, comment)
-                
-                # Only process new comments
-                if not comment_exists:
-                    logger.info(f"Adding NEW comment: {comment['id']}")
-                    new_content_added = True
-                    comment_count += 1
-                    session.execute_write(connect_comment_to_topic, comment["id"], topic_title, stance, discussion_id)
-
-                    # Extract arguments from the comment and store them in the graph
-                    arguments_with_stance = extract_and_classify_arguments(comment.get("body", ""), topic_title)
-                    for arg, stance_classified in arguments_with_stance:
-                        session.execute_write(merge_argument, arg, stance_classified, discussion_id)
-                        session.execute_write(connect_argument_to_comment, arg, comment["id"], discussion_id)
-                        argument_count += 1
-                
-                # Handle replies for the comment
-                for j, reply in enumerate(comment.get("replies", [])):
-                    # CRITICAL: Use deterministic ID generation - same input = same output
-                    original_reply_id = reply.get("id", "")
-                    
-                    if original_reply_id:
-                        # Simple, consistent format that never changes
-                        reply["id"] = f"reply_{original_reply_id}"
-                    else:
-                        # Deterministic fallback using comment ID and position
-                        reply["id"] = f"reply_{comment['id']}_{j}"
-                    
-                    reply.update({
-                        "discussion_id": discussion_id,
-                        "parent_comment_id": comment["id"]
-                    })
-
-                    # Debug logging
-                    logger.info(f"Processing reply ID: {reply['id']} for comment: {comment['id']}")
-                    
-                    # Check if the reply is already in the database
-                    reply_exists = session.execute_read(check_reply_exists, reply["id"], discussion_id)
-                    logger.info(f"Reply {reply['id']} already exists: {reply_exists}")
-                    
-                    # Always merge (update if exists, create if not)
-                    session.execute_write(merge_reply, reply)
-
-                    # Only process new replies
-                    if not reply_exists:
-                        logger.info(f"Adding NEW reply: {reply['id']}")
-                        new_content_added = True
-                        reply_count += 1
-                        session.execute_write(connect_reply_to_comment, reply["id"], comment["id"], discussion_id)
-
-                        # Extract and add arguments from the reply
-                        arguments_with_stance = extract_and_classify_arguments(reply.get("body", ""), topic_title)
-                        for arg, stance_classified in arguments_with_stance:
-                            session.execute_write(merge_argument, arg, stance_classified, discussion_id)
-                            session.execute_write(connect_argument_to_reply, arg, reply["id"], discussion_id)
-                            argument_count += 1
-                    else:
-                        logger.info(f"Skipping existing reply: {reply['id']}")
-
-        # Only regroup arguments if new content was added
-        if new_content_added:
-            logger.info("New content was added - regrouping arguments")
-            group_arguments_by_stance(discussion_id)
+    comments_by_id = {}  # Comments/replies by ID, to find the bodies of the new ones
+    replies_by_id = {}
+
+    # Comment and reply rows, merged in a single transaction
+    payload = {
+        "comments": [],
+        "replies": []
+    }
+
+    # Loop through each stance category: FOR, AGAINST, NEUTRAL
+    for stance in ["FOR", "AGAINST", "NEUTRAL"]:
+        for i, comment in enumerate(thread_data["classified_comments"].get(stance, [])):
+            # Ensure each comment has a unique ID - use original Reddit ID
+            original_comment_id = comment.get("id", "")
+            if not original_comment_id:
+                comment["id"] = f"comment_{stance}_{i}"
+            else:
+                comment["id"] = original_comment_id
+
+            # Always merge (update if exists, create if not)
+            payload["comments"].append(node_row(comment, stance=stance))
+            comments_by_id.setdefault(comment["id"], comment)
+
+    # Walk the reply trees breadth-first, so every parent is queued before its replies
+    # (items are (reply, position, parent ID, top-level comment ID))
+    pending = deque(
+        (reply, j, comment["id"], comment["id"])
+        for stance in ["FOR", "AGAINST", "NEUTRAL"]
+        for comment in thread_data["classified_comments"].get(stance, [])
+        for j, reply in enumerate(comment.get("replies", []))
+    )
+    while pending:
+        reply, j, parent_id, comment_id = pending.popleft()
+
+        # CRITICAL: Use deterministic ID generation - same input = same output
+        original_reply_id = reply.get("id", "")
+
+        if original_reply_id:
+            # Simple, consistent format that never changes
+            reply["id"] = f"reply_{original_reply_id}"
         else:
-            logger.info("No new content added - skipping argument regrouping")
+            # Deterministic fallback using parent ID and position
+            reply["id"] = f"reply_{parent_id}_{j}"
+
+        # Debug logging
+        logger.debug("Processing reply ID: %s for parent: %s", reply["id"], parent_id)
+
+        payload["replies"].append(node_row(reply, parent_id=parent_id, parent_comment_id=comment_id))
+        replies_by_id.setdefault(reply["id"], reply)
+
+        pending.extend((child, k, reply["id"], comment_id) for k, child in enumerate(reply.get("replies", [])))
+
+    with get_driver().session(database=NEO4J_DATABASE) as session:
+        # Merge the topic, comments and replies; the merge itself reports which ones are new or edited
+        discussion_id, (new_comment_ids, changed_comment_ids), (new_reply_ids, changed_reply_ids), needs_regroup = session.execute_write(
+            write_thread_nodes, payload, topic_title, str(uuid.uuid4()), thread_url
+        )
+        logger.info(f"Processing discussion: {discussion_id}")
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug(f"New comments: {sorted(new_comment_ids)}")
+            logger.debug(f"New replies: {sorted(new_reply_ids)}")
+
+        # Only new or edited comments and replies have their arguments extracted
+        new_comments = [comment for comment_id, comment in comments_by_id.items() if comment_id in new_comment_ids]
+        new_replies = [reply for reply_id, reply in replies_by_id.items() if reply_id in new_reply_ids]
+        changed_comments = [comment for comment_id, comment in comments_by_id.items() if comment_id in changed_comment_ids]
+        changed_replies = [reply for reply_id, reply in replies_by_id.items() if reply_id in changed_reply_ids]
+
+        # Edited ones first lose the arguments of their previous body
+        edited_owners = [
+            element_id
+            for changed_ids, new_ids in ((changed_comment_ids, new_comment_ids), (changed_reply_ids, new_reply_ids))
+            for owner_id, element_id in changed_ids.items()
+            if owner_id not in new_ids
+        ]
+        # (even when no slice is extracted, e.g. a comment edited down to "[deleted]")
+        if edited_owners:
+            session.execute_write(clear_owner_arguments, edited_owners, discussion_id)
+
+        # Extract arguments slice by slice, writing each slice while the next one is extracted
+        # (comments and replies too short or generic to hold an argument never reach the pipeline),
+        # each with the element ID its arguments are linked to
+        owners = [
+            (owner, changed_ids[owner["id"]])
+            for owners_of_kind, changed_ids in ((changed_comments, changed_comment_ids), (changed_replies, changed_reply_ids))
+            for owner in owners_of_kind
+            if not is_trivial_text(owner.get("body") or "")
+        ]
+        slices = [owners[i:i + EXTRACTION_SLICE_SIZE] for i in range(0, len(owners), EXTRACTION_SLICE_SIZE)]
+        argument_keys = set()  # Distinct arguments found in this run
+        seen_edges = set()     # (argument key, owner element ID) pairs already queued for writing
+        retry_owners = []      # Element IDs of owners whose extraction failed
+        extraction_pool = ThreadPoolExecutor(max_workers=1)
+        written = 0  # Owners whose slice of arguments is committed
+        try:
+            def extract(owner_slice):
+                return extraction_pool.submit(
+                    extract_and_classify_arguments, [owner.get("body") or "" for owner, _ in owner_slice], topic_title
+                )
+
+            future = extract(slices[0]) if slices else None
+            for index, owner_slice in enumerate(slices):
+                extracted, failed = future.result()
+                retry_owners.extend(owner_slice[i][1] for i in sorted(failed))
+                if index + 1 < len(slices):
+                    future = extract(slices[index + 1])
+
+                argument_rows = []  # Arguments of this slice's comments and replies, written together
+                for (owner, owner_element_id), arguments_with_stance in zip(owner_slice, extracted):
+                    for text, stance_classified in arguments_with_stance:
+                        key = argument_key(text)
+                        if (key, owner_element_id) in seen_edges:
+                            continue
+                        seen_edges.add((key, owner_element_id))
+                        argument_keys.add(key)
+                        argument_rows.append({
+                            "key": key,
+                            "text": text,
+                            "stance": stance_classified,
+                            "owner_element_id": owner_element_id
+                        })
+
+                # Write the slice's arguments and their links in one commit
+                session.execute_write(write_thread_arguments, argument_rows, discussion_id)
+                written += len(owner_slice)
+        except Exception:
+            # A failed extraction or write leaves every owner not yet written without arguments
+            retry_owners.extend(owner_element_id for _, owner_element_id in owners[written:])
+            raise
+        finally:
+            # Don't wait for (or start) an extraction whose slice will never be written
+            extraction_pool.shutdown(wait=False, cancel_futures=True)
+
+            # Owners whose extraction failed lose their body hash, so the next ingest of the
+            # thread sees them as edited and extracts them again
+            if retry_owners:
+                retry_owners = list(dict.fromkeys(retry_owners))
+                logger.warning(f"Argument extraction failed for {len(retry_owners)} comments/replies - they will be retried")
+                try:
+                    session.execute_write(reset_body_hashes, retry_owners)
+                except Exception as e:
+                    logger.error(f"Could not mark comments/replies for retry: {e}")
+        argument_count = len(argument_keys)
+
+        logger.info(
+            f"Wrote discussion {discussion_id}: {len(new_comments)} new comments, "
+            f"{len(new_replies)} new replies, {len(edited_owners)} edited, {argument_count} arguments"
+        )
+
+    # Arguments are only regrouped if new (or edited) content was added, or a previous regroup
+    # never finished; the caller runs it off the request path (see regroup_discussion)
+    new_content_added = bool(changed_comments or changed_replies)
+    if needs_regroup:
+        logger.info("Arguments need regrouping")
+    else:
+        logger.info("No new content added - skipping argument regrouping")
     
     return {
         "status": "success",
         "discussion_id": discussion_id,
         "nodes_created": {
             "topic": 1,
-            "comments": comment_count,
-            "replies": reply_count,
+            "comments": len(new_comments),
+            "replies": len(new_replies),
             "arguments": argument_count
         },
-        "new_content_added": new_content_added
+        "new_content_added": new_content_added,
+        "needs_regroup": needs_regroup,
+        # Comments/replies left without arguments this time (extracted again on the next ingest)
+        "extraction_failures": len(retry_owners)
     }
 
 
+# Returns the cached grouping answers of the given keys that haven't expired
+def load_cached_groupings(keys: List[str]) -> Dict[str, str]:
+    with argument_cache_lock:
+        rows = get_argument_cache().execute(
+            f"SELECT key, content FROM grouping_cache WHERE key IN ({','.join('?' * len(keys))}) AND created_at >= ?",
+            [*keys, time.time() - ARGUMENT_CACHE_TTL]
+        ).fetchall()
+    return dict(rows)
+
+def store_cached_groupings(contents: Dict[str, str]):
+    now = time.time()
+    with argument_cache_lock:
+        argument_cache = get_argument_cache()
+        argument_cache.executemany(
+            "INSERT OR REPLACE INTO grouping_cache (key, content, created_at) VALUES (?, ?, ?)",
+            [(key, content, now) for key, content in contents.items()]
+        )
+        argument_cache.commit()
+
 def group_arguments_by_stance(discussion_id: str):
-    if not argument_grouping_chain or not driver:
+    if not argument_grouping_chain:
         return
 
-    with driver.session() as session:
-        # First, clear existing argument groups for this discussion
-        session.run("""
-            MATCH (a:Argument {discussion_id: $discussion_id})-[r:HAS_GROUP]->(g:ArgumentGroup)
-            DELETE r
-            WITH DISTINCT g
-            WHERE NOT (g)<-[:HAS_GROUP]-()
-            DELETE g
-        """, discussion_id=discussion_id)
-
-        # Loop through each stance
-        for stance in ["FOR", "AGAINST", "NEUTRAL"]:
-            # Get all arguments for this stance and discussion
-            result = session.run("""
-                MATCH (a:Argument)
-                WHERE a.stance = $stance AND a.discussion_id = $discussion_id
-                RETURN a.text AS text
-            """, stance=stance, discussion_id=discussion_id)
-
-            arguments = [record["text"] for record in result if record["text"].strip()]
-            if not arguments:
-                continue
-
-            # Build prompt input
-            argument_block = "\n".join([f"- {arg}" for arg in arguments])
-            response = argument_grouping_chain.invoke({"arguments": argument_block, "stance": stance})
-            content = response.content.strip()
-
-            # Parse and process results
-            current_group = None
-            group_map = {}
-            for line in content.splitlines():
-                if line.strip().startswith("Group:"):
-                    current_group = line.replace("Group:", "").strip()
-                    group_map[current_group] = []
-                elif line.strip().startswith("-") and current_group:
-                    arg = line.strip().lstrip("-").strip()
-                    group_map[current_group].append(arg)
-
-            # Write group and links to database
-            for group_summary, arg_list in group_map.items():
-                # Create unique group identifier combining summary, stance, and discussion_id
-                session.run("""
-                    MERGE (g:ArgumentGroup {summary: $summary, stance: $stance, discussion_id: $discussion_id})
-                    SET g.updated_at = datetime()
-                """, summary=group_summary, stance=stance, discussion_id=discussion_id)
-
-                for arg in arg_list:
-                    session.run("""
-                        MATCH (a:Argument {text: $text, discussion_id: $discussion_id})
-                        MATCH (g:ArgumentGroup {summary: $summary, stance: $stance, discussion_id: $discussion_id})
-                        MERGE (a)-[:HAS_GROUP]->(g)
-                    """, text=arg, discussion_id=discussion_id, summary=group_summary, stance=stance)
+    # Get all arguments of the discussion at once, split by stance
+    # (sessions are only held for the database work, not while the LLM answers)
+    with get_driver().session(database=NEO4J_DATABASE) as session:
+        arguments_by_stance = {}
+        for stance, text in session.execute_read(get_discussion_arguments, discussion_id):
+            if text.strip():
+                arguments_by_stance.setdefault(stance, []).append(text)
+    stances = [stance for stance in ["FOR", "AGAINST", "NEUTRAL"] if stance in arguments_by_stance]
+
+    # A stance whose arguments didn't change reuses its previous grouping
+    # (arguments are sorted, since the database returns them in no particular order)
+    inputs = {
+        stance: {"arguments": "\n".join([f"- {arg}" for arg in sorted(arguments_by_stance[stance])]), "stance": stance}
+        for stance in stances
+    }
+    keys = {
+        stance: hashlib.blake2b(
+            f"{GROUPING_PROMPT_VERSION}\0{stance}\0{inputs[stance]['arguments']}".encode(), digest_size=16
+        ).hexdigest()
+        for stance in stances
+    }
+    contents = load_cached_groupings(list(keys.values()))
+    missing = [stance for stance in stances if keys[stance] not in contents]
+
+    # Group the arguments of every other stance in parallel
+    # (a failed stance keeps its previous groups instead of failing the others)
+    failed = set()
+    if missing:
+        responses = argument_grouping_chain.batch([inputs[stance] for stance in missing], return_exceptions=True)
+        fresh = {}
+        for stance, response in zip(missing, responses):
+            if isinstance(response, Exception):
+                logger.warning(f"Argument grouping failed for stance {stance}: {response}")
+                failed.add(stance)
+            else:
+                fresh[keys[stance]] = response.model_dump_json()
+        store_cached_groupings(fresh)
+        contents.update(fresh)
+    logger.info(f"Grouping cache: {len(stances) - len(missing)} hits, {len(missing)} misses")
+
+    groups = []  # Every group of every stance, written in a single query
+    for stance in stances:
+        if stance in failed:
+            continue
+        grouped = GroupedArguments.model_validate_json(contents[keys[stance]])
+
+        # Arguments were stored whitespace-normalized, so they are keyed the same way
+        # (an argument listed twice in a group is only linked once)
+        for group in grouped.groups:
+            groups.append({
+                "summary": group.summary.strip(),
+                "stance": stance,
+                "keys": list(dict.fromkeys(argument_key(normalize_whitespace(arg)) for arg in group.arguments))
+            })
+
+    # Replace the old groups of every regrouped stance with the new ones in a single commit
+    # (stances left without arguments lose their groups too)
+    regrouped = [stance for stance in ["FOR", "AGAINST", "NEUTRAL"] if stance not in failed]
+    with get_driver().session(database=NEO4J_DATABASE) as session:
+        session.execute_write(replace_argument_groups, groups, regrouped, discussion_id)
+        # (a stance that failed leaves the topic flagged, so the next ingest retries it)
+        if not failed:
+            session.execute_write(clear_needs_regroup, discussion_id)
+
+# Discussions being regrouped, and the ones asked to regroup again while that runs
+regroup_state_lock = threading.Lock()
+running_regroups = set()
+pending_regroups = set()
+
+# Regroups a discussion's arguments (meant to run in the background after create_knowledge_graph);
+# requests arriving while the same discussion is being regrouped coalesce into one more pass
+def regroup_discussion(discussion_id: str):
+    with regroup_state_lock:
+        if discussion_id in running_regroups:
+            pending_regroups.add(discussion_id)
+            return
+        running_regroups.add(discussion_id)
+
+    try:
+        while True:
+            group_arguments_by_stance(discussion_id)
+            with regroup_state_lock:
+                if discussion_id not in pending_regroups:
+                    running_regroups.discard(discussion_id)
+                    return
+                pending_regroups.discard(discussion_id)
+    except Exception:
+        # (the topic stays flagged, so the next ingest of the thread regroups it)
+        with regroup_state_lock:
+            running_regroups.discard(discussion_id)
+            pending_regroups.discard(discussion_id)
+        raise
 
 
 # Cypher helpers
-def check_existing_discussion_by_url(tx, url: str):
-    result = tx.run("""
-        MATCH (t:Topic {url: $url})
-        RETURN t.discussion_id AS discussion_id
-    """, url=url)
-    record = result.single()
-    return record["discussion_id"] if record else None
-
-def check_comment_exists(tx, comment_id, discussion_id):
+def get_discussion_arguments(tx, discussion_id):
     result = tx.run("""
-        MATCH (c:Comment {id: $comment_id, discussion_id: $discussion_id})
-        RETURN count(c) > 0 AS exists
-    """, comment_id=comment_id, discussion_id=discussion_id)
-    record = result.single()
-    return record["exists"] if record else False
-
-def check_reply_exists(tx, reply_id, discussion_id):
-    result = tx.run("""
-        MATCH (r:Reply {id: $reply_id, discussion_id: $discussion_id})
-        RETURN count(r) > 0 AS exists
-    """, reply_id=reply_id, discussion_id=discussion_id)
-    record = result.single()
-    return record["exists"] if record else False
-
-def merge_topic(tx, title, discussion_id, url):
+        MATCH (a:Argument {discussion_id: $discussion_id})
+        WHERE a.stance IN ["FOR", "AGAINST", "NEUTRAL"]
+        RETURN a.stance AS stance, a.text AS text
+    """, discussion_id=discussion_id)
+    return [(record["stance"], record["text"]) for record in result]
+
+# Only writes what changed: missing groups and links are merged, then links no longer in
+# the new grouping are removed (and groups left without arguments deleted), so regrouping a
+# mostly unchanged discussion rewrites next to nothing
+def replace_argument_groups(tx, groups, stances, discussion_id):
+    # Write groups and links to database
+    # (unique group identifier combines summary, stance, and discussion_id)
     tx.run("""
-        MERGE (t:Topic {url: $url})
-        SET t.title = $title,
-            t.discussion_id = $discussion_id,
-            t.updated_at = datetime()
-    """, title=title, discussion_id=discussion_id, url=url)
-
-def merge_comment(tx, comment):
-    tx.run("""
-        MERGE (c:Comment {id: $id, discussion_id: $discussion_id})
-        SET c.body = $body, c.author = $author, c.score = $score, c.updated_at = datetime()
-    """, **comment)
-
-def connect_comment_to_topic(tx, comment_id, topic_title, stance, discussion_id):
-    relationship = STANCE_MAP[stance]
-    tx.run(f"""
-        MATCH (t:Topic {{title: $topic_title, discussion_id: $discussion_id}})
-        MATCH (c:Comment {{id: $comment_id, discussion_id: $discussion_id}})
-        MERGE (c)-[:{relationship}]->(t)
-    """, topic_title=topic_title, comment_id=comment_id, discussion_id=discussion_id)
-
-def merge_reply(tx, reply):
+        UNWIND $groups AS group
+        MERGE (g:ArgumentGroup {summary: group.summary, stance: group.stance, discussion_id: $discussion_id})
+        ON CREATE SET g.updated_at = datetime()
+        WITH g, group
+        UNWIND group.keys AS key
+        MATCH (a:Argument {key: key, discussion_id: $discussion_id})
+        MERGE (a)-[:HAS_GROUP]->(g)
+    """, groups=groups, discussion_id=discussion_id)
+
+    # Then clear the stale links of these stances for this discussion
+    # (the argument keys of every new group, by stance and summary)
+    links = {}
+    for group in groups:
+        links.setdefault(f"{group['stance']}:{group['summary']}", []).extend(group["keys"])
     tx.run("""
-        MERGE (r:Reply {id: $id, discussion_id: $discussion_id})
-        SET r.body = $body, 
-            r.author = $author, 
-            r.score = $score, 
-            r.parent_comment_id = $parent_comment_id, 
-            r.updated_at = datetime()
-    """, **reply)
+        MATCH (a:Argument {discussion_id: $discussion_id})-[r:HAS_GROUP]->(g:ArgumentGroup)
+        WHERE g.stance IN $stances AND NOT a.key IN coalesce($links[g.stance + ":" + g.summary], [])
+        DELETE r
+        WITH DISTINCT g
+        WHERE NOT (g)<-[:HAS_GROUP]-()
+        DELETE g
+    """, stances=stances, links=links, discussion_id=discussion_id)
+
+# Returns the thread's discussion ID, for comments and replies the IDs of the new ones
+# and the element IDs of the new or edited ones (by ID), and whether it needs regrouping
+def write_thread_nodes(tx, payload, title, discussion_id, url):
+    record = tx.run(
+        THREAD_NODES_QUERY,
+        comments=payload["comments"], replies=payload["replies"], title=title, discussion_id=discussion_id, url=url
+    ).single()
+    return (
+        record["discussion_id"],
+        (set(record["new_comment_ids"]), dict(record["changed_comments"])),
+        (set(record["new_reply_ids"]), dict(record["changed_replies"])),
+        record["needs_regroup"]
+    )
 
-def connect_reply_to_comment(tx, reply_id, comment_id, discussion_id):
-    tx.run("""
-        MATCH (r:Reply {id: $reply_id, discussion_id: $discussion_id})
-        MATCH (c:Comment {id: $comment_id, discussion_id: $discussion_id})
-        MERGE (r)-[:REPLY_TO]->(c)
-    """, reply_id=reply_id, comment_id=comment_id, discussion_id=discussion_id)
+def clear_needs_regroup(tx, discussion_id):
+    tx.run("MATCH (t:Topic {discussion_id: $discussion_id}) REMOVE t.needs_regroup", discussion_id=discussion_id)
 
-def merge_argument(tx, text, stance, discussion_id):
-    tx.run("""
-        MERGE (a:Argument {text: $text, discussion_id: $discussion_id})
-        SET a.stance = $stance, a.updated_at = datetime()
-    """, text=text, stance=stance, discussion_id=discussion_id)
+def write_thread_arguments(tx, argument_rows, discussion_id):
+    for start in range(0, len(argument_rows), ARGUMENT_BATCH_SIZE):
+        merge_arguments(tx, argument_rows[start:start + ARGUMENT_BATCH_SIZE], discussion_id)
 
-def connect_argument_to_comment(tx, text, comment_id, discussion_id):
+# Makes comments/replies look edited on the next ingest (their arguments weren't extracted)
+def reset_body_hashes(tx, owners):
     tx.run("""
-        MATCH (a:Argument {text: $text, discussion_id: $discussion_id})
-        MATCH (c:Comment {id: $comment_id, discussion_id: $discussion_id})
-        MERGE (a)-[:EXTRACTED_FROM]->(c)
-    """, text=text, comment_id=comment_id, discussion_id=discussion_id)
+        UNWIND $owners AS owner_element_id
+        MATCH (source) WHERE elementId(source) = owner_element_id
+        REMOVE source.body_hash
+    """, owners=owners)
 
-def connect_argument_to_reply(tx, text, reply_id, discussion_id):
+# Unlinks the arguments of edited comments/replies, deleting the ones no longer extracted from anything
+def clear_owner_arguments(tx, owners, discussion_id):
+    tx.run("""
+        UNWIND $owners AS owner_element_id
+        MATCH (source) WHERE elementId(source) = owner_element_id
+        MATCH (a:Argument {discussion_id: $discussion_id})-[e:EXTRACTED_FROM]->(source)
+        DELETE e
+        WITH DISTINCT a
+        WHERE NOT (a)-[:EXTRACTED_FROM]->()
+        DETACH DELETE a
+    """, owners=owners, discussion_id=discussion_id)
+
+# Each row links its argument to the comment or reply it was extracted from
+# (found by the element ID the node merge returned, a direct lookup instead of an index seek)
+def merge_arguments(tx, rows, discussion_id):
     tx.run("""
-        MATCH (a:Argument {text: $text, discussion_id: $discussion_id})
-        MATCH (r:Reply {id: $reply_id, discussion_id: $discussion_id})
-        MERGE (a)-[:EXTRACTED_FROM]->(r)
-    """, text=text, reply_id=reply_id, discussion_id=discussion_id)
\ No newline at end of file
+        UNWIND $rows AS row
+        MATCH (owner) WHERE elementId(owner) = row.owner_element_id
+        MERGE (a:Argument {key: row.key, discussion_id: $discussion_id})
+        ON CREATE SET a.text = row.text
+        SET a.stance = row.stance, a.updated_at = datetime()
+        MERGE (a)-[:EXTRACTED_FROM]->(owner)
+    """, rows=rows, discussion_id=discussion_id)
\ No newline at end of file
@@ -1,9 +1,24 @@
-from typing import Any, Dict
-import requests                     # For making HTTP requests to external APIs (Reddit)
-from datetime import datetime
+from typing import Any, Dict, Optional
+import httpx                        # For making HTTP requests to external APIs (Reddit)
+import orjson
+import time
+from collections import deque
 from fastapi import HTTPException
 from pydantic import BaseModel      # Base class for defining request/response schemas in FastAPI
-import re
+
+# Reddit's escaped quote marker ('>') at the start of a quoted line
+QUOTE_PREFIX = "&gt;"
+
+# Standard user-agent header to avoid being blocked by Reddit's servers
+REDDIT_HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
+}
+
+# Shared HTTP/2 clients: connections to Reddit stay open between threads, so only the
+# first request pays for the TCP and TLS handshakes (redirects are followed, as requests did)
+REDDIT_LIMITS = httpx.Limits(max_connections=50, max_keepalive_connections=20)
+reddit_client = httpx.Client(http2=True, headers=REDDIT_HEADERS, timeout=30.0, limits=REDDIT_LIMITS, follow_redirects=True)
+reddit_async_client = httpx.AsyncClient(http2=True, headers=REDDIT_HEADERS, timeout=30.0, limits=REDDIT_LIMITS, follow_redirects=True)
 
 # Reddit Scraper Models
 # Define the request model for scraping a Reddit thread
@@ -16,67 +31,90 @@ class RedditResponse(BaseModel):
     
 
 # Function to extract thread data
-def fetch_reddit_data(url: str):
-    """Fetch Reddit thread data and comments, keeping top 10 comments and their replies."""
+def fetch_reddit_data(url: str, top_n: Optional[int] = 10):
+    """Fetch Reddit thread data and comments, keeping the top_n comments (all if None) and their replies."""
     try:
-        # Ensure the URL ends with a slash before appending '.json' for API access
-        if not url.endswith('/'):
-            url += '/'
-        api_url = f"{url}.json"
-        
-        # Standard user-agent header to avoid being blocked by Reddit's servers
-        headers = {
-            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
-        }
-        
         # Send GET request to Reddit's API
-        response = requests.get(api_url, headers=headers)
-        
-        # Raise HTTP error if request fails
-        if response.status_code != 200:
-            raise HTTPException(status_code=400, detail=f"Failed to access Reddit API: Status code {response.status_code}")
-        
-        # Parse JSON response (convert JSON response into python object) 
-        data = response.json()
-        
-        # Extract the main post data
-        post_data = data[0]['data']['children'][0]['data']
-        # Extract the top-level comments
-        comments_data = data[1]['data']['children']
-
-        # Filter out non-comment entries and AutoModerator
-        # Sort comments by score and take top 10
-        sorted_comments = sorted(
-            [c for c in comments_data if c.get('kind') == 't1' and c['data'].get('author') != "AutoModerator"], 
-            key=lambda x: x['data'].get('score', 0), 
-            reverse=True
-        )[:10]  # Keep top 10 by score
-
-        # Process comments and their replies (delegated to a helper function)
-        processed_comments = process_comments(sorted_comments)
-
-        # Build structured thread data
-        thread_data = {
-            'post': {
-                'title': post_data.get('title', ''),
-                'author': post_data.get('author', ''),
-                'created_utc': datetime.fromtimestamp(post_data.get('created_utc', 0)).strftime('%Y-%m-%d %H:%M:%S'),
-                'score': post_data.get('score', 0),
-                'upvote_ratio': post_data.get('upvote_ratio', 0),
-                'url': post_data.get('url', ''),
-                'selftext': process_text(post_data.get('selftext', '')),
-                'num_comments': post_data.get('num_comments', 0),
-                'subreddit': post_data.get('subreddit', '')
-            },
-            'comments': processed_comments
-        }
-        
-        return {"thread_data": thread_data}
+        response = reddit_client.get(reddit_api_url(url))
+        return parse_reddit_response(response, top_n)
     
     # Catch any unexpected error and return a 500 error via FastAPI
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error scraping Reddit thread: {str(e)}")
+
+
+# Same as fetch_reddit_data, without blocking the event loop (threads can be scraped concurrently)
+async def fetch_reddit_data_async(url: str, top_n: Optional[int] = 10):
+    """Fetch Reddit thread data and comments, keeping the top_n comments (all if None) and their replies."""
+    try:
+        response = await reddit_async_client.get(reddit_api_url(url))
+        return parse_reddit_response(response, top_n)
+
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error scraping Reddit thread: {str(e)}")
+
+
+# Helper function that builds the JSON API URL of a thread
+def reddit_api_url(url: str) -> str:
+    # Ensure the URL ends with a slash before appending '.json' for API access
+    if not url.endswith('/'):
+        url += '/'
+    return f"{url}.json"
+
+
+# Helper function that builds the thread data out of Reddit's API response
+def parse_reddit_response(response: httpx.Response, top_n: Optional[int]):
+    # Raise HTTP error if request fails
+    if response.status_code != 200:
+        raise HTTPException(status_code=400, detail=f"Failed to access Reddit API: Status code {response.status_code}")
+    
+    # Parse JSON response (convert JSON response into python object) 
+    # (orjson parses the raw bytes directly, noticeably faster on large threads)
+    data = orjson.loads(response.content)
     
+    # Extract the main post data
+    post_data = data[0]['data']['children'][0]['data']
+    # Extract the top-level comments
+    comments_data = data[1]['data']['children']
+
+    # Filter out non-comment entries and AutoModerator
+    # Sort comments by score and take the top_n (every comment, in Reddit's order, if None)
+    sorted_comments = [c for c in comments_data if c.get('kind') == 't1' and c['data'].get('author') != "AutoModerator"]
+    if top_n is not None:
+        sorted_comments = sorted(
+            sorted_comments,
+            key=lambda x: x['data'].get('score', 0), 
+            reverse=True
+        )[:top_n]  # Keep top_n by score
+
+    # Process comments and their replies (delegated to a helper function)
+    processed_comments = process_comments(sorted_comments)
+
+    # Build structured thread data
+    thread_data = {
+        'post': {
+            'title': post_data.get('title', ''),
+            'author': post_data.get('author', ''),
+            'created_utc': format_timestamp(post_data.get('created_utc', 0)),
+            'score': post_data.get('score', 0),
+            'upvote_ratio': post_data.get('upvote_ratio', 0),
+            'url': post_data.get('url', ''),
+            'selftext': process_text(post_data.get('selftext', '')),
+            'num_comments': post_data.get('num_comments', 0),
+            'subreddit': post_data.get('subreddit', '')
+        },
+        'comments': processed_comments
+    }
+    
+    return {"thread_data": thread_data}
+    
+
+# Helper function that formats a Unix timestamp as 'YYYY-MM-DD HH:MM:SS' (local time, like
+# datetime.fromtimestamp), straight from the time struct without building a datetime
+def format_timestamp(timestamp):
+    t = time.localtime(timestamp)
+    return f"{t.tm_year:04d}-{t.tm_mon:02d}-{t.tm_mday:02d} {t.tm_hour:02d}:{t.tm_min:02d}:{t.tm_sec:02d}"
+
 
 # Helper function to clean up post text
 def process_text(text):
@@ -87,48 +125,57 @@ def process_text(text):
     - Adds '**End of Citation**' after the last quoted line.
     - Removes the quote symbol ('&gt;') from quoted lines.
     """
-    lines = text.split("\n")    # Split the text into individual lines
+    return "\n".join(iter_processed_lines(text))   # Reassemble processed text
+
+
+# Helper generator that yields the processed lines of a post/comment text
+def iter_processed_lines(text):
     inside_citation = False     # Flag to track if we're inside a quoted block
-    processed_lines = []
 
-    for line in lines:
-        # Detect if the line starts with a Reddit quote ('&gt;')
-        if re.match(r"^\s*&gt;", line):  # If the line starts with '>'
+    for line in text.split("\n"):  # Split the text into individual lines
+        # Detect if the line starts with a Reddit quote ('&gt;'), in a single scan without regexes
+        stripped = line.lstrip()
+        if stripped.startswith(QUOTE_PREFIX):  # If the line starts with '>'
             if not inside_citation:
-                processed_lines.append("**Citing:**\n")  # Add citation start marker
+                yield "**Citing:**\n"  # Add citation start marker
                 inside_citation = True
             # Remove '&gt;' and any extra spaces from the start of the line
-            processed_lines.append(re.sub(r"^\s*&gt;\s*", "", line)) 
+            yield stripped[len(QUOTE_PREFIX):].lstrip()
         else:
             if inside_citation:  
-                processed_lines.append("\n**End of Citation**")  # Add citation end marker
+                yield "\n**End of Citation**"  # Add citation end marker
                 inside_citation = False
-            processed_lines.append(line)
+            yield line
 
     # If the last lines were quotes, close the citation
     if inside_citation:  
-        processed_lines.append("\n**End of Citation**")  
-
-    return "\n".join(processed_lines)   # Reassemble processed text
+        yield "\n**End of Citation**"
 
 
 # Helper function that processes comments 
 def process_comments(comments_data, level=0, parent_body=None):
     """
-    Recursively processes Reddit comments and their direct replies.
+    Processes Reddit comments and all their nested replies, walking the reply tree
+    breadth-first with a queue (no recursion, so deep threads can't hit the recursion limit).
 
     Args:
         comments_data (list): List of comment dicts from Reddit JSON.
-        level (int): Current nesting level (0 = top-level, increases with replies).
+        level (int): Nesting level of these comments (0 = top-level, increases with replies).
         parent_body (str): The body text of the parent comment, used for context.
 
     Returns:
-        list: A list of processed comment dicts with metadata and nested replies.
+        list: A list of processed comment dicts with metadata and nested replies
+              (replies also carry the original Reddit ID of their parent).
     """
     processed = []
 
-    # Skip anything that is not a comment 
-    for comment in comments_data:
+    # Each entry: (raw comment, list its object is appended to, level, parent body, parent ID)
+    # (siblings leave the queue in order, so every replies list keeps Reddit's order)
+    pending = deque((comment, processed, level, parent_body, None) for comment in comments_data)
+    while pending:
+        comment, siblings, level, parent_body, parent_id = pending.popleft()
+
+        # Skip anything that is not a comment 
         if comment.get('kind') != 't1':  
             continue
 
@@ -143,77 +190,26 @@ def process_comments(comments_data, level=0, parent_body=None):
         formatted_body = process_text(body_text)  
 
         # Build comment object - use original Reddit ID directly
-        comment_obj = {
-            'id': comment_data.get('id', ''),  # Original Reddit ID
+        # (let kg_creator handle unique ID generation consistently)
+        comment_obj = {'id': comment_data.get('id', '')}  # Original Reddit ID
+        if parent_id is not None:
+            comment_obj['parent_comment_id'] = parent_id  # Track parent relationship
+        comment_obj.update({
             'author': comment_data.get('author', ''),
-            'created_utc': datetime.fromtimestamp(comment_data.get('created_utc', 0)).strftime('%Y-%m-%d %H:%M:%S') if comment_data.get('created_utc') else None,
+            'created_utc': format_timestamp(comment_data['created_utc']) if comment_data.get('created_utc') else None,
             'body': formatted_body,
             'score': comment_data.get('score', 0),
             'level': level,
             'parent_body': parent_body,  # Include parent comment context
             'replies': []
-        }
+        })
+        siblings.append(comment_obj)
 
-        # If the comment has replies, process them recursively
+        # If the comment has replies, queue them one level deeper
         if comment_data.get('replies') and comment_data['replies'] != '':
-            replies_data = comment_data['replies']['data']['children']
-            comment_obj['replies'] = process_replies(replies_data, comment_data.get('id', ''), level + 1, formatted_body)
-
-        processed.append(comment_obj)
-
-    return processed
-
-
-def process_replies(replies_data, parent_comment_id, level=1, parent_body=None):
-    """
-    Process replies keeping original Reddit IDs for consistency.
-    
-    Args:
-        replies_data (list): List of reply dicts from Reddit JSON.
-        parent_comment_id (str): The ID of the parent comment.
-        level (int): Current nesting level.
-        parent_body (str): The body text of the parent comment.
-        
-    Returns:
-        list: A list of processed reply dicts with original Reddit IDs.
-    """
-    processed_replies = []
-
-    for j, reply in enumerate(replies_data):
-        if reply.get('kind') != 't1':
-            continue
-
-        reply_data = reply['data']
-        body_text = reply_data.get('body', '').strip()
-
-        # Skip AutoModerator, system messages, deleted, or removed comments
-        if reply_data.get('author') == "AutoModerator" or body_text.lower() in ["[deleted]", "[removed]"]:
-            continue
-
-        # Apply citation formatting to reply body
-        formatted_body = process_text(body_text)
-
-        # Use original Reddit ID - let kg_creator handle unique ID generation consistently
-        original_reply_id = reply_data.get('id', '')
-
-        # Build reply object with original Reddit ID
-        reply_obj = {
-            'id': original_reply_id,  # Keep original Reddit ID
-            'parent_comment_id': parent_comment_id,  # Track parent relationship
-            'author': reply_data.get('author', ''),
-            'created_utc': datetime.fromtimestamp(reply_data.get('created_utc', 0)).strftime('%Y-%m-%d %H:%M:%S') if reply_data.get('created_utc') else None,
-            'body': formatted_body,
-            'score': reply_data.get('score', 0),
-            'level': level,
-            'parent_body': parent_body,
-            'replies': []
-        }
-
-        # If this reply has nested replies, process them recursively
-        if reply_data.get('replies') and reply_data['replies'] != '':
-            nested_replies_data = reply_data['replies']['data']['children']
-            reply_obj['replies'] = process_replies(nested_replies_data, original_reply_id, level + 1, formatted_body)
-
-        processed_replies.append(reply_obj)
+            pending.extend(
+                (reply, comment_obj['replies'], level + 1, formatted_body, comment_data.get('id', ''))
+                for reply in comment_data['replies']['data']['children']
+            )
 
-    return processed_replies
\ No newline at end of file
+    return processed
\ No newline at end of file
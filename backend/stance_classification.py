@@ -1,5 +1,7 @@
 from pydantic import BaseModel
-from langchain.prompts import PromptTemplate
+from typing import List
+import re
+from langchain.prompts import ChatPromptTemplate
 from langchain_openai import ChatOpenAI
 import os
 
@@ -13,6 +15,17 @@ class StanceClassificationRequest(BaseModel):
     identified_topic: str
     comment_body: str
 
+# Define batch request model (one thread, many comments/replies)
+class StanceBatchItem(BaseModel):
+    id: str
+    comment_body: str
+
+class StanceClassificationBatchRequest(BaseModel):
+    thread_title: str
+    thread_selftext: str
+    identified_topic: str
+    items: List[StanceBatchItem]
+
 # Initialize LangChain stance detection model
 stance_model = ChatOpenAI(
     model="gpt-4o",  
@@ -21,10 +34,11 @@ stance_model = ChatOpenAI(
     max_tokens=10
 )
 
-# Define stance classification prompt using LangChain's PromptTemplate
-stance_prompt = PromptTemplate(
-    input_variables=["thread_title", "thread_selftext", "identified_topic", "comment_body"],
-    template="""
+# Define stance classification prompt using LangChain's ChatPromptTemplate
+# (static instructions first, then the thread context shared by every comment of a thread,
+# so OpenAI can reuse the cached prompt prefix across calls)
+stance_prompt = ChatPromptTemplate.from_messages([
+    ("system", """
     You are an AI trained in stance detection. Your task is to classify a Reddit comment's stance toward the discussion topic based on the full thread context.
     Analyze the given Reddit post and comment carefully, and return ONLY ONE of the following labels:
     - AGAINST
@@ -32,7 +46,8 @@ stance_prompt = PromptTemplate(
     - NEUTRAL
 
     Keep in mind that the comments can contain sarcasm and irony. Do NOT provide any explanation, analysis, or additional text.
-
+    """),
+    ("human", """
     Reddit Thread:
     Title: "{thread_title}"
     Post Content: "{thread_selftext}"
@@ -42,12 +57,49 @@ stance_prompt = PromptTemplate(
     "{comment_body}"
 
     Label:
-    """
-)
+    """)
+])
 
 # Create LangChain chain for stance classification
 stance_chain = stance_prompt | stance_model
 
+# Labels a comment can get; anything else the model answers counts as NEUTRAL
+STANCE_LABELS = {"FOR", "AGAINST", "NEUTRAL"}
+
+# Comments classified together in one call by the batch classifier
+STANCE_BATCH_SIZE = 15
+
+# Numbered answer line of a batch call (e.g. "3. AGAINST")
+NUMBERED_STANCE = re.compile(r"^\s*(\d+)[\.\)]\s*(FOR|AGAINST|NEUTRAL)\b", re.MULTILINE | re.IGNORECASE)
+
+# Same instructions for many comments of a thread, numbered and answered one label per line
+stance_batch_prompt = ChatPromptTemplate.from_messages([
+    ("system", """
+    You are an AI trained in stance detection. Your task is to classify the stance of each of several Reddit comments toward the discussion topic based on the full thread context.
+    Analyze the given Reddit post and each numbered comment carefully, and label every comment with ONLY ONE of the following labels:
+    - AGAINST
+    - FOR
+    - NEUTRAL
+
+    Keep in mind that the comments can contain sarcasm and irony. Classify each comment on its own.
+    Answer with one line per comment, in order, formatted as "<number>. <label>". Do NOT provide any explanation, analysis, or additional text.
+    """),
+    ("human", """
+    Reddit Thread:
+    Title: "{thread_title}"
+    Post Content: "{thread_selftext}"
+    Identified Discussion Topic: "{identified_topic}"
+
+    Reddit Comments:
+    {comments_block}
+
+    Labels:
+    """)
+])
+
+# A label line takes a few tokens, so the output cap grows with the batch
+stance_batch_chain = stance_batch_prompt | stance_model.bind(max_tokens=8 * STANCE_BATCH_SIZE)
+
 # Function to classify stance
 def stance_classifier(request: StanceClassificationRequest):
     response = stance_chain.invoke({
@@ -57,4 +109,39 @@ def stance_classifier(request: StanceClassificationRequest):
         "comment_body": request.comment_body
     })
 
-    return {"stance": response.content.strip()}
\ No newline at end of file
+    return {"stance": response.content.strip()}
+
+# Function to classify the stance of many comments of the same thread at once
+# (up to STANCE_BATCH_SIZE comments per call, numbered; comments missing from an answer
+# are classified one by one)
+def stance_classifier_batch(request: StanceClassificationBatchRequest):
+    thread = {
+        "thread_title": request.thread_title,
+        "thread_selftext": request.thread_selftext,
+        "identified_topic": request.identified_topic
+    }
+    chunks = [request.items[i:i + STANCE_BATCH_SIZE] for i in range(0, len(request.items), STANCE_BATCH_SIZE)]
+    responses = stance_batch_chain.batch([
+        {
+            **thread,
+            # One line per comment, so the numbers stay unambiguous
+            "comments_block": "\n".join(f"{n}. {' '.join(item.comment_body.split())}" for n, item in enumerate(chunk, 1))
+        }
+        for chunk in chunks
+    ])
+
+    stances = {}
+    for chunk, response in zip(chunks, responses):
+        labels = {int(n): label.upper() for n, label in NUMBERED_STANCE.findall(response.content)}
+        for n, item in enumerate(chunk, 1):
+            if n in labels:
+                stances[item.id] = labels[n]
+
+    missing = [item for item in request.items if item.id not in stances]
+    if missing:
+        responses = stance_chain.batch([{**thread, "comment_body": item.comment_body} for item in missing])
+        for item, response in zip(missing, responses):
+            label = response.content.strip().upper()
+            stances[item.id] = label if label in STANCE_LABELS else "NEUTRAL"
+
+    return {"stances": stances}
\ No newline at end of file
@@ -1,8 +1,10 @@
-from langchain.prompts import PromptTemplate
+from langchain.prompts import ChatPromptTemplate
 from langchain_openai import ChatOpenAI
 from typing import Dict, List
 import os
 from pydantic import BaseModel
+import tiktoken
+from functools import lru_cache
 
 # Retrieve API key from environment variable
 openai_api_key = os.getenv("OPENAI_API_KEY")
@@ -19,9 +21,9 @@ summarizer = ChatOpenAI(
 )
 
 # Define summarization prompt (back to the original approach)
-summarizer_prompt = PromptTemplate(
-    input_variables=["comments"],
-    template="""
+# Static instructions go in the system message so OpenAI can cache that prompt prefix
+summarizer_prompt = ChatPromptTemplate.from_messages([
+    ("system", """
     You are an expert at synthesizing online discussions. 
     Given the following user comments that share a similar stance in an online discussion, summarize the key points into a few concise bullet points.
     
@@ -35,24 +37,46 @@ summarizer_prompt = PromptTemplate(
     - Economic Barriers: Many people want children but face high costs of childcare, healthcare, and housing.
     - Cultural Priorities: Modern values emphasize personal freedom and career growth, delaying or reducing interest in parenthood.
     - Policy Skepticism: Financial incentives like $5,000 are seen as insufficient or ineffective in changing birth rates.
-
+    """),
+    ("human", """
     ### Comments:
     {comments}
 
     ### Summary (bullet points):
-    """
-)
+    """)
+])
 
 # Create summarization chain
 summary_chain = summarizer_prompt | summarizer
 
+# Maximum number of comment tokens sent in a single summarization prompt
+SUMMARY_TOKEN_BUDGET = 12000
+
+# Tokenizer loaded on first use, not at import (loading it may download the encoding)
+@lru_cache(maxsize=1)
+def get_encoding():
+    return tiktoken.encoding_for_model("gpt-4o")
+
+# Helper function that keeps comments, in order, while they fit in the token budget
+# (comments arrive highest-scored first, so the least relevant ones are dropped)
+def trim_to_token_budget(comments: List[str], budget: int = SUMMARY_TOKEN_BUDGET) -> List[str]:
+    kept = []
+    used = 0
+    for comment, tokens in zip(comments, get_encoding().encode_batch(comments)):
+        cost = len(tokens) + 1  # Joining newline
+        if used + cost > budget:
+            continue
+        kept.append(comment)
+        used += cost
+    return kept
+
 def summarize_grouped_comments(grouped_comments: Dict[str, List[str]]) -> Dict:
     """Summarizes FOR, AGAINST, and NEUTRAL comments separately."""
     summaries = {}
 
     for stance, comments in grouped_comments.items():
         if comments:
-            summary_input = {"comments": "\n".join(comments)}
+            summary_input = {"comments": "\n".join(trim_to_token_budget(comments))}
             summaries[stance] = summary_chain.invoke(summary_input).content.strip()
         else:
             summaries[stance] = "No significant arguments found."
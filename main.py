@@ -1,9 +1,9 @@
-from fastapi import FastAPI
-from backend.reddit_scraper import fetch_reddit_data, RedditRequest, RedditResponse
+from fastapi import BackgroundTasks, FastAPI
+from backend.reddit_scraper import fetch_reddit_data_async, RedditRequest, RedditResponse
 from backend.topic_identifier import topicIdentifier, TopicIdentifierRequest
 from backend.summarize import summarize_grouped_comments
-from backend.stance_classification import stance_classifier, StanceClassificationRequest
-from backend.kg_creator import KGRequest, create_knowledge_graph
+from backend.stance_classification import stance_classifier, stance_classifier_batch, StanceClassificationRequest, StanceClassificationBatchRequest
+from backend.kg_creator import KGRequest, create_knowledge_graph, regroup_discussion
 from typing import Dict, List
 
 
@@ -22,7 +22,7 @@ async def summarize_comments_endpoint(request: Dict[str, Dict[str, List[str]]]):
 # Reddit scraper endpoint
 @app.post("/reddit_scraper", response_model=RedditResponse)
 async def scrape_reddit_thread(request: RedditRequest):
-    return fetch_reddit_data(request.url)
+    return await fetch_reddit_data_async(request.url)
 
 # Topic identifier endpoint
 @app.post("/topicIdentifier")
@@ -34,9 +34,19 @@ async def identify_topic(request: TopicIdentifierRequest):
 async def classify_stance(request: StanceClassificationRequest):
     return stance_classifier(request)
 
+# Batch stance classifier endpoint (one call per thread chunk)
+# (plain def: FastAPI runs it in a worker thread, so the blocking LLM calls don't stall the event loop)
+@app.post("/stanceClassifier_batch")
+def classify_stance_batch(request: StanceClassificationBatchRequest):
+    return stance_classifier_batch(request)
+
 # Knowledge graph creator endpoint
+# (argument regrouping runs after the response is sent)
 @app.post("/kgCreator")
-def build_kg(request: KGRequest):
-    return create_knowledge_graph(request.thread_data)
+def build_kg(request: KGRequest, background_tasks: BackgroundTasks):
+    result = create_knowledge_graph(request.thread_data)
+    if result["needs_regroup"]:
+        background_tasks.add_task(regroup_discussion, result["discussion_id"])
+    return result
 
 
@@ -1,5 +1,5 @@
 import streamlit as st
-from neo4j import GraphDatabase
+from neo4j import GraphDatabase, READ_ACCESS
 import os
 from dotenv import load_dotenv
 import pandas as pd
@@ -9,12 +9,25 @@ load_dotenv()
 neo4j_uri = os.getenv("NEO4J_URI")
 neo4j_user = os.getenv("NEO4J_USER")
 neo4j_password = os.getenv("NEO4J_PASSWORD")
-
-driver = GraphDatabase.driver(neo4j_uri, auth=(neo4j_user, neo4j_password))
-
-# Run a Cypher query
+neo4j_database = os.getenv("NEO4J_DATABASE", "neo4j")
+
+# One driver (and connection pool) shared by every rerun and session
+@st.cache_resource
+def get_neo4j_driver():
+    return GraphDatabase.driver(
+        neo4j_uri,
+        auth=(neo4j_user, neo4j_password),
+        max_connection_pool_size=50,
+        connection_acquisition_timeout=60,
+        max_connection_lifetime=3600,
+        keep_alive=True
+    )
+
+driver = get_neo4j_driver()
+
+# Run a Cypher query (this page only reads, so a cluster can route it to a replica)
 def run_query(cypher, parameters={}):
-    with driver.session() as session:
+    with driver.session(database=neo4j_database, default_access_mode=READ_ACCESS) as session:
         results = session.run(cypher, parameters)
         return [record.data() for record in results]
 
@@ -38,12 +51,12 @@ st.markdown(f"### {selected_topic}")
 
 # After topic selection, display metrics
 if selected_topic:
-    # Get counts by stance for this topic using the working query
+    # Get counts by stance for this topic
+    # (arguments are found through the discussion_id index, once per post they were extracted from,
+    # instead of testing every argument's post against the topic's relationship types)
     stance_counts = run_query("""
         MATCH (t:Topic {title: $title})
-        MATCH (a:Argument)-[:EXTRACTED_FROM]->(n)
-        WHERE (n:Comment)-[:SUPPORTS|OPPOSES|NEUTRAL]->(t)
-        OR (n:Reply)-[:REPLY_TO]->(:Comment)-[:SUPPORTS|OPPOSES|NEUTRAL]->(t)
+        MATCH (a:Argument {discussion_id: t.discussion_id})-[:EXTRACTED_FROM]->(n)
         RETURN a.stance AS Stance, count(*) AS Count
     """, 
     {"title": selected_topic})
@@ -146,18 +159,14 @@ if selected_topic:
         "List of Arguments by Stance": {
             "query": """
                 MATCH (t:Topic {title: $title})
-                MATCH (a:Argument)-[:EXTRACTED_FROM]->(n)
-                WHERE (n:Comment)-[:SUPPORTS|OPPOSES|NEUTRAL]->(t)
-                OR (n:Reply)-[:REPLY_TO]->(:Comment)-[:SUPPORTS|OPPOSES|NEUTRAL]->(t)
+                MATCH (a:Argument {discussion_id: t.discussion_id})-[:EXTRACTED_FROM]->(n)
                 RETURN a.text AS Argument, a.stance AS Stance
             """
         },
         "Argument Groups by Popularity": {
             "query": """
                 MATCH (t:Topic {title: $title})
-                MATCH (a:Argument)-[:EXTRACTED_FROM]->(n)
-                WHERE (n:Comment)-[:SUPPORTS|OPPOSES|NEUTRAL]->(t)
-                OR (n:Reply)-[:REPLY_TO]->(:Comment)-[:SUPPORTS|OPPOSES|NEUTRAL]->(t)
+                MATCH (a:Argument {discussion_id: t.discussion_id})-[:EXTRACTED_FROM]->(n)
                 MATCH (a)-[:HAS_GROUP]->(g:ArgumentGroup)
                 RETURN 
                 g.summary AS GroupSummary,
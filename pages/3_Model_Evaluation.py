@@ -1,6 +1,6 @@
 import streamlit as st
 import pandas as pd
-from neo4j import GraphDatabase
+from neo4j import GraphDatabase, READ_ACCESS
 from langchain.prompts import PromptTemplate
 from langchain_openai import ChatOpenAI
 import os
@@ -12,13 +12,20 @@ from dotenv import load_dotenv
 # Load environment variables
 load_dotenv()
 
+# Database the evaluation reads from (read-only sessions can be routed to a replica)
+NEO4J_DATABASE = os.getenv("NEO4J_DATABASE", "neo4j")
+
 # Neo4j connection
 @st.cache_resource
 def get_neo4j_driver():
     try:
         driver = GraphDatabase.driver(
             os.getenv("NEO4J_URI"),
-            auth=(os.getenv("NEO4J_USER"), os.getenv("NEO4J_PASSWORD"))
+            auth=(os.getenv("NEO4J_USER"), os.getenv("NEO4J_PASSWORD")),
+            max_connection_pool_size=50,
+            connection_acquisition_timeout=60,
+            max_connection_lifetime=3600,
+            keep_alive=True
         )
         return driver
     except Exception as e:
@@ -37,7 +44,7 @@ def get_evaluator_llm():
 # Database query functions
 def get_available_topics(driver):
     """Get all available discussion topics from Neo4j"""
-    with driver.session() as session:
+    with driver.session(database=NEO4J_DATABASE, default_access_mode=READ_ACCESS) as session:
         result = session.run("""
             MATCH (t:Topic)
             RETURN t.title AS title, t.discussion_id AS discussion_id, t.url AS url
@@ -47,7 +54,7 @@ def get_available_topics(driver):
 
 def get_discussion_data(driver, discussion_id: str):
     """Get complete discussion data for evaluation including replies"""
-    with driver.session() as session:
+    with driver.session(database=NEO4J_DATABASE, default_access_mode=READ_ACCESS) as session:
         # Get topic info
         topic_result = session.run("""
             MATCH (t:Topic {discussion_id: $discussion_id})